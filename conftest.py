@@ -0,0 +1,52 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Synthetic panel shared by the tests of the native engines.
+
+import numpy as np
+import pytest
+
+import draws
+import hcm
+import mixed_logit
+import model_spec
+from mixed_logit import ATTRIBUTES, N_ALTERNATIVES
+
+
+N_PERSONS = 30
+N_DRAWS = 20
+
+
+@pytest.fixture(scope='session')
+def panel():
+    """Respondents with 4 to 6 tasks, so that the panel is padded."""
+    rng = np.random.default_rng(3)
+    tasks = rng.integers(4, 7, N_PERSONS)
+    ids = np.repeat(np.arange(N_PERSONS), tasks)
+    rows = len(ids)
+    attributes = rng.integers(0, 2, (rows, N_ALTERNATIVES, len(ATTRIBUTES))).astype(float)
+    attributes[..., mixed_logit.COST] = rng.choice([0.5, 1.0, 2.0, 3.0],
+                                                   (rows, N_ALTERNATIVES))
+    choice = rng.integers(1, N_ALTERNATIVES + 1, rows)
+    covariates = np.column_stack([rng.integers(18, 66, N_PERSONS),
+                                  rng.integers(0, 2, (N_PERSONS, 6)),
+                                  rng.integers(0, 4, N_PERSONS),
+                                  rng.integers(1, 8, N_PERSONS)])[ids]
+    indicators = rng.choice([-3, -1, 1, 3], (N_PERSONS, hcm.N_INDICATORS))[ids]
+    return mixed_logit.pack_panel(ids, attributes, choice, covariates, indicators)
+
+
+@pytest.fixture(scope='session')
+def evaluation():
+    """Function of a model name returning ``(beta, draws)``: the script
+    starting values of NI, perturbed, and standard normal draws for the
+    panel."""
+    def setup(model):
+        spec = model_spec.build(model, 'NI')
+        beta = spec.start + np.random.default_rng(4).normal(0, 0.02, len(spec.start))
+        return beta, draws.normal_draws(N_PERSONS, N_DRAWS, spec.n_dims)
+    return setup
@@ -0,0 +1,56 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Covariance matrices of the estimates from the per-person scores.
+#
+# The engines return the (persons x parameters) score matrix S of the final
+# likelihood evaluation, and estimation.estimate keeps it, so the outer
+# product of gradients is available without further simulated likelihood
+# passes:
+#
+#   BHHH      (S'S)^-1
+#   sandwich  A^-1 (S'S) A^-1,  A = -Hessian of the log-likelihood
+#
+# The limited-memory inverse Hessian of L-BFGS-B is far too crude for the
+# bread of the sandwich, so A is passed in, e.g. from a finite-difference
+# Hessian of the analytic gradient.
+
+import numpy as np
+
+
+def outer_product(scores):
+    """S'S, the sum over persons of the outer products of the scores."""
+    scores = np.asarray(scores)
+    return scores.T @ scores
+
+
+def bhhh(scores):
+    """BHHH covariance matrix (S'S)^-1."""
+    return np.linalg.inv(outer_product(scores))
+
+
+def sandwich(scores, hessian):
+    """Robust covariance matrix A^-1 (S'S) A^-1, A = -hessian.
+
+    ``hessian`` is the Hessian of the log-likelihood, negative definite at a
+    maximum.
+    """
+    bread = np.linalg.inv(-np.asarray(hessian))
+    bread = (bread + bread.T) / 2
+    return bread @ outer_product(scores) @ bread
+
+
+def standard_errors(covariance):
+    """Square roots of the diagonal of a covariance matrix."""
+    return np.sqrt(np.diag(covariance))
+
+
+def table(names, estimates, covariance):
+    """Rows (name, estimate, standard error, t-test) as in Biogeme's report."""
+    errors = standard_errors(covariance)
+    return [(name, value, error, value / error)
+            for name, value, error in zip(names, estimates, errors)]
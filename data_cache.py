@@ -0,0 +1,162 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Columnar binary cache of ThreeModelComparisonENERGY.txt.
+#
+# The whitespace-delimited file is parsed once into a directory next to it,
+#
+#   ThreeModelComparisonENERGY.columns/
+#       manifest.json      sha256, size and modification time of the
+#                          source, number of rows, and the dtype and number
+#                          of 99999 missing-value codes of every column
+#       <column>.npy       the column, as the smallest integer type that
+#                          holds it or float64
+#
+# and the columns are memory-mapped on first access, so a run only reads the
+# columns it uses.  The 99999 codes are kept in the columns themselves, as
+# the exclusion rules of the scripts rely on them (their outlier bounds
+# remove the rows with missing values).  The source is only hashed when its
+# size or modification time differs from the manifest, and the cache is
+# rebuilt when the sha256 changes.
+
+import hashlib
+import json
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+
+DATA_FILE = 'ThreeModelComparisonENERGY.txt'
+
+MISSING = 99999
+
+CACHE_SUFFIX = '.columns'
+
+_INTEGER_TYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+def cache_directory(path=DATA_FILE):
+    """Cache directory of a data file."""
+    return os.path.splitext(path)[0] + CACHE_SUFFIX
+
+
+def read_table(path=DATA_FILE):
+    """Columns of the whitespace-delimited data file, as a dict of arrays."""
+    with open(path) as f:
+        names = f.readline().split()
+    values = np.loadtxt(path, skiprows=1, ndmin=2)
+    return {name: values[:, i] for i, name in enumerate(names)}
+
+
+def source_hash(path):
+    """sha256 of the contents of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _manifest(directory):
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _compact(values):
+    # Smallest integer type holding integral values, float64 otherwise
+    if np.all(values == np.round(values)):
+        for dtype in _INTEGER_TYPES:
+            info = np.iinfo(dtype)
+            if info.min <= values.min() and values.max() <= info.max:
+                return values.astype(dtype)
+    return values
+
+
+def _write_manifest(directory, manifest):
+    # Under a temporary name, as concurrent jobs may read it
+    path = os.path.join(directory, 'manifest.json')
+    temporary = '%s.%d.tmp' % (path, os.getpid())
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temporary, path)
+
+
+def ingest(path=DATA_FILE, directory=None):
+    """Build the cache of a data file unless it is up to date.
+
+    A source with the size and modification time of the manifest is taken
+    as unchanged without reading it; otherwise its sha256 decides.  The
+    manifest is written last, so an interrupted ingestion is redone on the
+    next call.  Returns the manifest.
+    """
+    directory = directory or cache_directory(path)
+    status = os.stat(path)
+    stamp = {'size': status.st_size, 'mtime_ns': status.st_mtime_ns}
+    manifest = _manifest(directory)
+    if manifest is not None and all(manifest.get(key) == stamp[key] for key in stamp):
+        return manifest
+    digest = source_hash(path)
+    if manifest is not None and manifest['sha256'] == digest:
+        manifest.update(stamp)
+        _write_manifest(directory, manifest)
+        return manifest
+
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, 'manifest.json')
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    # Columns and everything derived from them (see exclusion.py)
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+
+    columns = read_table(path)
+    manifest = {'source': os.path.basename(path), 'sha256': digest, **stamp,
+                'rows': len(next(iter(columns.values()))), 'columns': {}}
+    for name, values in columns.items():
+        values = _compact(values)
+        np.save(os.path.join(directory, name + '.npy'), values)
+        manifest['columns'][name] = {'dtype': values.dtype.str,
+                                     'missing': int((values == MISSING).sum())}
+    _write_manifest(directory, manifest)
+    return manifest
+
+
+class Columns(Mapping):
+    """Read-only mapping of column name to memory-mapped array."""
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.manifest = manifest
+        self._arrays = {}
+
+    @property
+    def n_rows(self):
+        return self.manifest['rows']
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            if name not in self.manifest['columns']:
+                raise KeyError(name)
+            self._arrays[name] = np.load(os.path.join(self.directory, name + '.npy'),
+                                         mmap_mode='r')
+        return self._arrays[name]
+
+    def __iter__(self):
+        return iter(self.manifest['columns'])
+
+    def __len__(self):
+        return len(self.manifest['columns'])
+
+
+def columns(path=DATA_FILE, directory=None):
+    """Columns of a data file from its cache, ingesting it first if needed."""
+    directory = directory or cache_directory(path)
+    return Columns(directory, ingest(path, directory))
@@ -0,0 +1,89 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Derived variables of the scripts, computed once per data version.
+#
+# The scripts build every derived variable with a chain of DefineVariable
+# updates, e.g.
+#
+#   Zenv1 = DefineVariable('Zenv1', 0 )
+#   Zenv1 = ( Zenv1 - 3 * (env1 == 1))
+#   ...
+#   cohabit = ( cohabit + 1 * (marital_status == 2) + 1 * (marital_status == 5))
+#
+# Here each one is a (source column, operation, argument) definition.  The
+# operation is applied to the distinct values of the source column only and
+# spread to the rows by an index lookup.  For data read through data_cache
+# the result is stored in the cache directory next to the raw columns,
+# keyed by a hash of the definition, and rebuilt with the cache when the
+# data change.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import data_cache
+
+
+# Zenv: env 1..4 -> -3, -1, 1, 3; any other value keeps the initial 0
+ZENV = {1: -3, 2: -1, 3: 1, 4: 3}
+
+# name -> (source column, operation, argument)
+DEFINITIONS = dict(
+    [('age', ('age', 'copy', None)),
+     ('female', ('female', 'copy', None)),
+     ('cohabit', ('marital_status', 'in', (2, 5))),
+     ('numchild', ('num_children', 'copy', None)),
+     ('higheduc', ('education', '>', 4)),
+     ('employed', ('economic_status', '<', 4)),
+     ('green', ('buy_green_energy', '==', 1)),
+     ('polorient', ('ideo', 'copy', None)),
+     ('highincome', ('income', '>', 4))]
+    + [('Zenv%d' % i, ('env%d' % i, 'map', ZENV)) for i in range(1, 8)])
+
+_OPERATIONS = {'in': lambda values, argument: np.isin(values, argument),
+               '<': lambda values, argument: values < argument,
+               '>': lambda values, argument: values > argument,
+               '==': lambda values, argument: values == argument,
+               'map': lambda values, argument: np.array([argument.get(value, 0)
+                                                         for value in values.tolist()],
+                                                        dtype=np.int8)}
+
+
+def derive(column, operation, argument):
+    """Apply a definition to a column through a lookup on its distinct values."""
+    values, inverse = np.unique(column, return_inverse=True)
+    return _OPERATIONS[operation](values, argument)[inverse]
+
+
+def _key(name):
+    text = json.dumps([name, DEFINITIONS[name]], sort_keys=True, default=str)
+    return 'derived-%s-%s.npy' % (name, hashlib.sha256(text.encode()).hexdigest()[:16])
+
+
+def value(columns, name):
+    """Derived variable ``name`` of DEFINITIONS, one value per row.
+
+    Stored next to the columns when ``columns`` is a data_cache.Columns.
+    """
+    source, operation, argument = DEFINITIONS[name]
+    if operation == 'copy':
+        return columns[source]
+    if not isinstance(columns, data_cache.Columns):
+        return derive(columns[source], operation, argument)
+
+    path = os.path.join(columns.directory, _key(name))
+    if not os.path.exists(path):
+        # Written under a temporary name, as concurrent jobs may derive the
+        # same variable.
+        temporary = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary, 'wb') as f:
+            np.save(f, derive(columns[source], operation, argument))
+        os.replace(temporary, path)
+    return np.load(path, mmap_mode='r')
@@ -0,0 +1,57 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Persistent store of simulation draws.
+#
+# Every script regenerates 2000 MLHS draws per person from Seed = 17 on each
+# run.  Here draws are generated once per key
+#
+#   (generator, seed, number of persons, number of draws, dimensions, transform)
+#
+# saved as a .npy file and memory-mapped read-only into the estimator, so
+# repeated estimations and re-runs after a crash use identical draws without
+# regenerating them.
+
+import os
+import tempfile
+
+import numpy as np
+
+import draws
+
+
+DRAW_DIRECTORY = 'draws'
+
+
+def path(n_persons, n_draws, n_dims, generator='mlhs', seed=17, transform='normal',
+         directory=DRAW_DIRECTORY):
+    """File holding the draws of a key."""
+    name = '%s-seed%d-%dx%dx%d-%s.npy' % (generator, seed, n_persons, n_draws, n_dims, transform)
+    return os.path.join(directory, name)
+
+
+def cached_draws(n_persons, n_draws, n_dims, generator='mlhs', seed=17, transform='normal',
+                 directory=DRAW_DIRECTORY):
+    """Draws of shape (n_persons x n_draws x n_dims), memory-mapped.
+
+    The draws are generated with draws.generate() the first time a key is
+    requested.  The file is written under a temporary name and renamed into
+    place, so an interrupted run never leaves a truncated file behind.
+    """
+    target = path(n_persons, n_draws, n_dims, generator, seed, transform, directory)
+    if not os.path.exists(target):
+        os.makedirs(directory, exist_ok=True)
+        values = draws.generate(n_persons, n_draws, n_dims, generator, seed, transform)
+        handle, temporary = tempfile.mkstemp(suffix='.npy', dir=directory)
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                np.save(f, values)
+            os.replace(temporary, target)
+        except BaseException:
+            os.remove(temporary)
+            raise
+    return np.load(target, mmap_mode='r')
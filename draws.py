@@ -0,0 +1,123 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Simulation draws for the native likelihood engines.
+#
+# Draws are returned as a (persons x draws x dimensions) array of standard
+# normals, one block of draws per respondent, which is the layout the
+# engines broadcast over.
+#
+# Generators:
+#   mlhs               modified Latin hypercube, as RandomDistribution = "MLHS"
+#                      of the Biogeme scripts
+#   halton             the Halton sequence of gmnl/mlogit, as configured in
+#                      ThreeModelComparisonENERGY_2021_09_14.R
+#   sobol              scrambled Sobol
+#   randomized_halton  scrambled Halton
+
+import warnings
+
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+
+# haltons = list(primes = c(2,5,7,11,13,17,19), drop = rep(19,7)) of the R
+# script; further dimensions (omegaLVEnv of the HCM) continue with the next
+# primes.
+HALTON_PRIMES = (2, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47)
+HALTON_DROP = 19
+
+
+def mlhs(n_persons, n_draws, n_dims, seed=17):
+    """Modified Latin hypercube draws (Hess, Train and Polak, 2006).
+
+    For every person and dimension the unit interval is split into
+    ``n_draws`` strata, one shifted point is placed in each stratum and the
+    points are shuffled.  This is the scheme behind Biogeme's
+    ``RandomDistribution = "MLHS"``; the stream itself is NumPy's, so the
+    draws are not bit-identical to a Biogeme run with the same seed.
+    Returns uniforms of shape (n_persons, n_draws, n_dims).
+    """
+    rng = np.random.default_rng(seed)
+    shift = rng.random((n_persons, 1, n_dims))
+    points = (np.arange(n_draws)[None, :, None] + shift) / n_draws
+    return rng.permuted(np.broadcast_to(points, (n_persons, n_draws, n_dims)), axis=1)
+
+
+def normal_draws(n_persons, n_draws, n_dims, seed=17):
+    """Standard normal MLHS draws of shape (n_persons, n_draws, n_dims)."""
+    return ndtri(mlhs(n_persons, n_draws, n_dims, seed))
+
+
+def radical_inverse(index, base):
+    """Van der Corput radical inverse of integer indices in a base."""
+    index = np.array(index, dtype=np.int64)
+    result = np.zeros(index.shape)
+    factor = 1.0 / base
+    while np.any(index):
+        index, digit = np.divmod(index, base)
+        result += digit * factor
+        factor /= base
+    return result
+
+
+def halton(n_persons, n_draws, n_dims, seed=None, primes=HALTON_PRIMES, drop=HALTON_DROP):
+    """Halton draws in the layout of gmnl's make.draws.
+
+    mlogit's halton(prime, length, drop) builds the sequence 0, 1/p, 2/p,
+    ... (the radical inverse of 0, 1, 2, ...) and discards its first
+    ``drop`` elements; dimension k uses ``primes[k]``.  gmnl takes
+    n_persons * n_draws consecutive elements and gives every respondent a
+    block of n_draws of them, in order.  The sequence is deterministic, so
+    ``seed`` is ignored; ``drop`` may be a sequence with one value per
+    dimension.  Returns uniforms of shape (n_persons, n_draws, n_dims).
+    """
+    if n_dims > len(primes):
+        raise ValueError('%d dimensions need more than %d primes' % (n_dims, len(primes)))
+    drop = np.broadcast_to(drop, (n_dims,))
+    index = np.arange(n_persons * n_draws)
+    points = np.empty((n_persons * n_draws, n_dims))
+    for k in range(n_dims):
+        points[:, k] = radical_inverse(index + drop[k], primes[k])
+    return points.reshape(n_persons, n_draws, n_dims)
+
+
+def _scrambled(engine, n_persons, n_draws):
+    # One randomized sequence of n_persons * n_draws points, in consecutive
+    # blocks of n_draws per person as for halton().  Sobol warns when the
+    # length is not a power of two; the per-person blocks never are.
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        points = engine.random(n_persons * n_draws)
+    return points.reshape(n_persons, n_draws, -1)
+
+
+def sobol(n_persons, n_draws, n_dims, seed=17):
+    """Scrambled Sobol draws (Owen scrambling with a digital shift)."""
+    return _scrambled(qmc.Sobol(n_dims, scramble=True, seed=seed), n_persons, n_draws)
+
+
+def randomized_halton(n_persons, n_draws, n_dims, seed=17):
+    """Scrambled Halton draws (random digit permutations)."""
+    return _scrambled(qmc.Halton(n_dims, scramble=True, seed=seed), n_persons, n_draws)
+
+
+# Uniform generators by name, called as generator(n_persons, n_draws, n_dims, seed)
+GENERATORS = {'mlhs': mlhs,
+              'halton': halton,
+              'sobol': sobol,
+              'randomized_halton': randomized_halton}
+
+# Transforms applied to the uniforms
+TRANSFORMS = {'uniform': lambda u: u,
+              'normal': ndtri}
+
+
+def generate(n_persons, n_draws, n_dims, generator='mlhs', seed=17, transform='normal'):
+    """Draws from a named generator and transform."""
+    return TRANSFORMS[transform](GENERATORS[generator](n_persons, n_draws, n_dims, seed))
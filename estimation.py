@@ -0,0 +1,178 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Maximum simulated likelihood estimation on top of the native engines.
+#
+# The engines return the log-likelihood together with its analytic gradient,
+# so a quasi-Newton optimizer can be used directly instead of CFSQP with
+# symbolic or finite-difference derivatives.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.optimize import minimize
+
+import mixed_logit
+
+
+class Threaded:
+    """Engine function of beta evaluated on person blocks in a thread pool.
+
+    See threaded().  The pool is shut down by close(), or on leaving a
+    ``with`` block.
+    """
+
+    def __init__(self, loglikelihood_and_score, blocks, chunk):
+        self.loglikelihood_and_score = loglikelihood_and_score
+        self.blocks = blocks
+        self.chunk = chunk
+        self.executor = ThreadPoolExecutor(len(blocks)) if len(blocks) > 1 else None
+
+    def __call__(self, beta):
+        if self.executor is None:
+            return self.loglikelihood_and_score(beta, *self.blocks[0], self.chunk)
+        # Floating-point error handling is per thread; pass the caller's on.
+        settings = np.geterr()
+
+        def block_result(block):
+            with np.errstate(**settings):
+                return self.loglikelihood_and_score(beta, *block, self.chunk)
+        parts = list(self.executor.map(block_result, self.blocks))
+        scores = np.concatenate([part[2] for part in parts])
+        return sum(part[0] for part in parts), scores.sum(axis=0), scores
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def threaded(loglikelihood_and_score, panel, draws, n_threads, chunk=None, evaluators=1):
+    """Evaluate an engine on blocks of respondents in a thread pool.
+
+    ``loglikelihood_and_score(beta, panel, draws, chunk)`` is rpl_uc's or
+    hcm's.  The likelihood is a sum over respondents, so the person blocks
+    are independent; NumPy releases the GIL inside the array operations and
+    the blocks run concurrently.  The draw chunk size is set for all blocks
+    together, so that their chunks fit in memory at the same time, and
+    shared with ``evaluators`` - 1 other evaluations running in other
+    processes (see mixed_logit.chunk_size).  Returns a Threaded, a function
+    of ``beta`` with the engine's ``(loglikelihood, gradient, scores)``
+    result, to be closed after use.
+    """
+    chunk = chunk or mixed_logit.chunk_size(panel, draws.shape[1], draws.shape[2], evaluators)
+    edges = np.linspace(0, len(draws), max(1, n_threads) + 1).astype(int)
+    blocks = [(mixed_logit.persons(panel, start, stop), draws[start:stop])
+              for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+    if len(blocks) == 1:
+        blocks = [(panel, draws)]
+    return Threaded(loglikelihood_and_score, blocks, chunk)
+
+
+def estimate(loglikelihood_and_score, start, bounds=None, names=None,
+             maxiter=1000, tol=1e-8):
+    """Maximize a simulated log-likelihood with L-BFGS-B.
+
+    ``loglikelihood_and_score(beta)`` returns ``(loglikelihood, gradient,
+    scores)`` as the engines do, with one row of ``scores`` per person.
+    ``bounds`` is a list of (lower, upper) pairs as in the Beta definitions
+    of the scripts.  The optimizer works on the log-likelihood per person so
+    that its first, unscaled step stays small; trial points where the
+    simulated likelihood underflows are rejected by the line search, and
+    a result whose log-likelihood is not finite (a non-finite start) is
+    never reported as converged.  Returns a dict with the estimates, the final log-likelihood and
+    gradient, the per-person scores at the estimates and the optimizer
+    diagnostics.
+    """
+    scale = [None]
+    last = {}
+
+    def objective(beta):
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            value, gradient, scores = loglikelihood_and_score(beta)[:3]
+        if scale[0] is None:
+            scale[0] = 1.0 / len(scores)
+        finite = np.isfinite(value) and np.all(np.isfinite(gradient))
+        last.update(beta=beta.copy(), scores=scores, value=value, finite=finite)
+        if not finite:
+            # A large finite value makes the line search backtrack; inf
+            # would stop L-BFGS-B at the current point.
+            return 1e10, np.zeros_like(gradient)
+        return -value * scale[0], -gradient * scale[0]
+
+    result = minimize(objective, np.asarray(start, dtype=float), jac=True,
+                      method='L-BFGS-B', bounds=bounds,
+                      options={'maxiter': maxiter, 'ftol': tol, 'gtol': 1e-6})
+    # The scores of the final evaluation are kept for covariance.py; the
+    # optimizer may have evaluated a rejected trial point last.
+    if not np.array_equal(last['beta'], result.x):
+        objective(result.x)
+    converged, message = bool(result.success), str(result.message)
+    loglikelihood = -result.fun / scale[0]
+    if not last['finite']:
+        # Only reached from a non-finite start: the sentinel's zero
+        # gradient looks like an optimum to L-BFGS-B.
+        converged = False
+        message = 'log-likelihood or gradient not finite at the estimates'
+        loglikelihood = last['value']
+    return {'names': list(names) if names is not None else None,
+            'estimates': result.x,
+            'loglikelihood': loglikelihood,
+            'gradient': -result.jac / scale[0],
+            'scores': last['scores'],
+            'iterations': result.nit,
+            'evaluations': result.nfev,
+            'converged': converged,
+            'message': message}
+
+
+# Draws per person of the stages of estimate_progressive()
+SCHEDULE = (100, 250, 500, 1000, 2000)
+
+# Convergence tolerance of the stages before the last one
+STAGE_TOL = 1e-6
+
+
+def estimate_progressive(loglikelihood_and_score, draws, start, schedule=SCHEDULE,
+                         bounds=None, names=None, maxiter=1000, tol=1e-8, stage_tol=STAGE_TOL):
+    """Estimate on an increasing number of draws per person.
+
+    ``loglikelihood_and_score(draws)`` returns the engine function of beta
+    for a draw array, e.g. ``lambda d: threaded(kernel, panel, d, 4)``;
+    it is closed after its stage when it has a close() method, as the
+    Threaded evaluators have.
+    Stage s uses the first ``schedule[s]`` draws of every person, so the
+    draw sets are nested and each stage refines the previous one; it starts
+    from the previous optimum.  The intermediate stages stop at
+    ``stage_tol``, the last one at ``tol``.  Returns the result of the last
+    stage with a ``stages`` list of (draws, loglikelihood, iterations,
+    evaluations).
+    """
+    if schedule[-1] > draws.shape[1]:
+        raise ValueError('schedule needs %d draws per person, %d given'
+                         % (schedule[-1], draws.shape[1]))
+    stages = []
+    for stage, n_draws in enumerate(schedule):
+        last = stage == len(schedule) - 1
+        evaluate = loglikelihood_and_score(draws[:, :n_draws])
+        try:
+            result = estimate(evaluate, start, bounds, names, maxiter,
+                              tol if last else stage_tol)
+        finally:
+            if hasattr(evaluate, 'close'):
+                evaluate.close()
+        start = result['estimates']
+        stages.append((n_draws, result['loglikelihood'], result['iterations'],
+                       result['evaluations']))
+    result['stages'] = stages
+    return result
@@ -0,0 +1,126 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Exclusion rules of the scripts, declared as data.
+#
+# BIOGEME_OBJECT.EXCLUDE is a sum of 24 comparisons evaluated on every row.
+# Here each comparison is a (column, operator, value) rule; a row is
+# excluded when any rule of its country holds.  The rules are evaluated
+# column-wise into one boolean mask, together with the number of rows each
+# rule matches.  For data read through data_cache the result is stored in
+# the cache directory, keyed by country and a hash of the rules, and
+# rebuilt with the cache when the data change.  99999 marks missing values;
+# they are caught by the outlier bounds.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import data_cache
+
+
+# country = 1 -> England, 2 -> NI, 3 -> Scotland
+COUNTRIES = {'England': 1, 'NI': 2, 'Scotland': 3}
+
+OPERATORS = {'<': np.less, '>': np.greater}
+
+# The country clauses of the three versions of every script
+COUNTRY_RULES = {'England': (('country', '>', 1),),
+                 'NI': (('country', '<', 2), ('country', '>', 2)),
+                 'Scotland': (('country', '<', 3),)}
+
+# The remaining clauses, common to all scripts
+RULES = ((('Double_id', '<', 2),
+          ('too_short', '<', 10),
+          ('age', '<', 18),
+          ('age', '>', 65),
+          ('Block', '>', 100))
+         + tuple(('env%d' % i, '>', 4) for i in range(1, 8))
+         + (('pay_elecbill', '>', 6000),
+            ('marital_status', '>', 100),
+            ('num_children', '>', 10),
+            ('num_adults', '>', 6),
+            ('education', '>', 100),
+            ('economic_status', '>', 100),
+            ('distance_coast', '>', 900),
+            ('buy_green_energy', '>', 100),
+            ('ideo', '>', 100),
+            ('income', '>', 100),
+            ('ChoiceSum', '>', 29)))
+
+
+def country_name(country):
+    """Name of a country given by name or code."""
+    for name, code in COUNTRIES.items():
+        if country == code:
+            return name
+    return country
+
+
+def rules(country):
+    """All exclusion rules of a country (name or code)."""
+    return COUNTRY_RULES[country_name(country)] + RULES
+
+
+def label(rule):
+    """'age > 65' for ('age', '>', 65)."""
+    return '%s %s %s' % rule
+
+
+def evaluate(columns, rules):
+    """Excluded rows (bool) and the number of rows matched by each rule."""
+    mask = np.zeros(len(columns[rules[0][0]]), dtype=bool)
+    counts = []
+    for column, operator, value in rules:
+        hit = OPERATORS[operator](columns[column], value)
+        counts.append(int(hit.sum()))
+        mask |= hit
+    return mask, counts
+
+
+def _key(country, country_rules):
+    text = json.dumps([list(rule) for rule in country_rules])
+    return 'exclusion-%s-%s' % (country, hashlib.sha256(text.encode()).hexdigest()[:16])
+
+
+def exclusions(columns, country):
+    """Excluded rows of a country and a dict of per-rule match counts.
+
+    Cached next to the columns when ``columns`` is a data_cache.Columns.
+    """
+    country = country_name(country)
+    country_rules = rules(country)
+    if not isinstance(columns, data_cache.Columns):
+        mask, counts = evaluate(columns, country_rules)
+        return mask, dict(zip(map(label, country_rules), counts))
+
+    path = os.path.join(columns.directory, _key(country, country_rules))
+    if os.path.exists(path + '.json'):
+        with open(path + '.json') as f:
+            counts = json.load(f)
+        mask = np.unpackbits(np.load(path + '.npy'), count=columns.n_rows).astype(bool)
+        return mask, counts
+
+    mask, counts = evaluate(columns, country_rules)
+    counts = dict(zip(map(label, country_rules), counts))
+    # Written under temporary names, as concurrent jobs may read or write
+    # the same cache; the .json, which marks the cache as complete, last.
+    temporary = '%s.%d.tmp' % (path, os.getpid())
+    with open(temporary + '.npy', 'wb') as f:
+        np.save(f, np.packbits(mask))
+    os.replace(temporary + '.npy', path + '.npy')
+    with open(temporary + '.json', 'w') as f:
+        json.dump(counts, f, indent=1)
+    os.replace(temporary + '.json', path + '.json')
+    return mask, counts
+
+
+def excluded(columns, country):
+    """Rows removed by BIOGEME_OBJECT.EXCLUDE of the scripts for a country."""
+    return exclusions(columns, country)[0]
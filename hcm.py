@@ -0,0 +1,212 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Native simulated log-likelihood and analytic gradient of the hybrid choice
+# model (HCM) of ThreeModelComparisonENERGY-HCM-*.py.
+#
+# Structural equation:
+#   LVEnv = sum_d bsc_d * d + omegaLVEnv
+#
+# Measurement equations, indicator i = 1..7 with Zenv_i in {-3, -1, 1, 3}:
+#   tau_i2 = tau_i1 + delta_i2,  tau_i3 = tau_i2 + delta_i3
+#   P(Zenv_i = c) = F(tau_upper - alpha_i * LVEnv) - F(tau_lower - alpha_i * LVEnv)
+#   with F the logistic CDF, F(tau_0) = 0 and F(tau_4) = 1.
+#
+# Choice model:
+#   R_bbATTRk = bbATTRk + bbATTRkLVEnv * LVEnv + sdbATTRk * draw
+#   R_bbATTR3cost = -exp( same index for the cost attribute )
+
+import numpy as np
+
+import mixed_logit
+import ordered_logit
+from mixed_logit import ATTRIBUTES, COST
+from rpl_uc import DEMOGRAPHICS, asc
+
+
+# Explanatory variables of the structural equation, in the order of the
+# bsc_* Betas of the scripts.  They are read from Panel.covariates, which
+# follows rpl_uc.DEMOGRAPHICS.
+STRUCTURAL = ('age', 'female', 'cohabit', 'numchild', 'higheduc',
+              'employed', 'green', 'polorient', 'highincome')
+
+N_INDICATORS = 7
+
+
+def _measurement_names(i):
+    return ['tau%dLVEnv1' % i, 'delta%dLVEnv2' % i, 'delta%dLVEnv3' % i, 'alpha%dLVEnv' % i]
+
+
+def _choice_names(attribute):
+    prefix, level = attribute[:5], attribute[5:]
+    return ['bb' + attribute, 'bb%sLVEnv%s' % (prefix, level)]
+
+
+# Parameter vector layout, in the order of the Beta definitions of the scripts
+PARAMETERS = (['bsc_' + name for name in STRUCTURAL]
+              + [name for i in range(1, N_INDICATORS + 1) for name in _measurement_names(i)]
+              + ['ASC1', 'ASC3']
+              + [name for attribute in ATTRIBUTES for name in _choice_names(attribute)]
+              + ['sdb' + attribute for attribute in ATTRIBUTES])
+
+# (lower, upper) bounds of the Beta definitions; the threshold increments
+# delta are constrained to be non-negative.
+BOUNDS = ([(-10000, 10000)] * len(STRUCTURAL)
+          + [bound for i in range(N_INDICATORS)
+             for bound in ((-10000, 10000), (0, 10000), (0, 10000), (-100, 100))]
+          + [(-100, 100)] * (2 + 3 * len(ATTRIBUTES)))
+
+_STRUCTURAL = slice(0, len(STRUCTURAL))
+_COLUMNS = [DEMOGRAPHICS.index(name) for name in STRUCTURAL]
+_MEASUREMENT = len(STRUCTURAL)
+_ASC = _MEASUREMENT + 4 * N_INDICATORS
+_MEAN = slice(_ASC + 2, _ASC + 2 + 2 * len(ATTRIBUTES), 2)
+_LOADING = slice(_ASC + 3, _ASC + 3 + 2 * len(ATTRIBUTES), 2)
+_SD = slice(_ASC + 2 + 2 * len(ATTRIBUTES), None)
+
+
+def _hcm_asc(beta):
+    return asc(beta[_ASC:_ASC + 2])
+
+
+def latent_variable(beta, covariates, omega):
+    """LVEnv per person and draw (persons x draws)."""
+    return (covariates[:, _COLUMNS] @ beta[_STRUCTURAL])[:, None] + omega
+
+
+def person_indicators(panel):
+    """Indicators as a (persons x 7) array if they are person-level.
+
+    env1..env7 are answered once per respondent and repeated on every
+    choice row.  When that holds for every respondent the measurement
+    equations only need to be evaluated once per person; otherwise None is
+    returned and the row-level Biogeme form is kept.
+    """
+    first = panel.indicators[:, :1]
+    if np.all((panel.indicators == first) | ~panel.mask[..., None]):
+        return first[:, 0]
+    return None
+
+
+def _log_product(p):
+    # log of the product over the indicators; a probability below the
+    # smallest normal float is floored there, as the task probabilities in
+    # mixed_logit.sequence_weights
+    return np.log(np.maximum(p, np.finfo(p.dtype).tiny)).sum(axis=-1)
+
+
+def _measurement(beta, lv, panel):
+    # Sum(Elem(meKLVEnv, ZenvK),'panelObsIter')/Sum(1,'panelObsIter') for
+    # every indicator, multiplied together, as in condLikelihoodOneObs; the
+    # product is formed as a sum of logs, which does not underflow in
+    # float32 when the seven probabilities are small.
+    # With person-level indicators the average over the panel rows is the
+    # probability of the person's answer itself, so the fused ordered logit
+    # kernel is evaluated once per person and draw for all seven
+    # indicators.  Otherwise the kernel runs per task and the probabilities
+    # are averaged over the rows.
+    # Returns the log measurement factor (persons x draws), the derivatives of
+    # its log with respect to the 28 measurement parameters
+    # (persons x draws x 28) and with respect to LVEnv (persons x draws).
+    parameters = beta[_MEASUREMENT:_ASC].reshape(N_INDICATORS, 4)
+    indicators = person_indicators(panel)
+    if indicators is not None:
+        p, d_parameters, d_lv = ordered_logit.probabilities(
+            parameters, lv, ordered_logit.category_index(indicators))
+        return (_log_product(p), d_parameters.reshape(lv.shape + (-1,)),
+                d_lv.sum(axis=-1))
+
+    total = np.zeros(lv.shape + (N_INDICATORS,), dtype=lv.dtype)
+    d_parameters = np.zeros(total.shape + (4,), dtype=lv.dtype)
+    d_lv = np.zeros_like(total)
+    for t in range(panel.mask.shape[1]):
+        p, d_parameters_t, d_lv_t = ordered_logit.probabilities(
+            parameters, lv, ordered_logit.category_index(panel.indicators[:, t]))
+        p *= panel.mask[:, None, t, None]
+        total += p
+        d_parameters += p[..., None] * d_parameters_t
+        d_lv += p * d_lv_t
+    d_parameters /= total[..., None]
+    d_lv /= total
+    log_factor = _log_product(total / panel.mask.sum(axis=1)[:, None, None])
+    return log_factor, d_parameters.reshape(lv.shape + (-1,)), d_lv.sum(axis=-1)
+
+
+def _coefficients(beta, lv, draws):
+    b = beta[_MEAN] + beta[_LOADING] * lv[..., None] + beta[_SD] * draws
+    b[..., COST] = -np.exp(b[..., COST])
+    return b
+
+
+def loglikelihood(beta, panel, draws, chunk=None):
+    """Simulated log-likelihood of the hybrid choice model.
+
+    ``beta`` follows PARAMETERS, ``panel`` is a mixed_logit.Panel with
+    indicators Zenv1..Zenv7, and ``draws`` are standard normal draws of
+    shape (persons x draws x 8): omegaLVEnv first, then the seven
+    RND_ATTR* draws.  The draws are processed ``chunk`` at a time, by
+    default as many as fit in memory (mixed_logit.chunk_size).
+    """
+    return loglikelihood_and_score(beta, panel, draws, chunk)[0]
+
+
+def _accumulate(beta, panel, draws):
+    # Sum over the draws of L_nr and of L_nr * d log L_nr (persons x
+    # parameters), both relative to exp(scale); computed in the precision
+    # of the draws.
+    beta = beta.astype(draws.dtype)
+    lv = latent_variable(beta, panel.covariates, draws[..., 0])
+    xi = draws[..., 1:]
+
+    b = _coefficients(beta, lv, xi)
+    v = mixed_logit.utilities(b, _hcm_asc(beta).astype(draws.dtype), panel.attributes)
+    p = mixed_logit.logit(v)
+    d_coefficients, d_asc = mixed_logit.sequence_score(p, panel.choice, panel.mask,
+                                                       panel.attributes)
+    d_coefficients[..., COST] *= b[..., COST]
+
+    log_measurement, d_measurement, d_lv = _measurement(beta, lv, panel)
+    d_lv += d_coefficients @ beta[_LOADING]
+
+    scale, conditional = mixed_logit.sequence_weights(p, panel.choice, panel.mask,
+                                                      log_measurement)
+
+    def weighted_sum(d):
+        return np.einsum('nr,nr...->n...', conditional, d)
+
+    weighted = np.empty((len(conditional), len(PARAMETERS)), dtype=conditional.dtype)
+    weighted[:, _STRUCTURAL] = weighted_sum(d_lv)[:, None] * panel.covariates[:, _COLUMNS]
+    weighted[:, _MEASUREMENT:_ASC] = weighted_sum(d_measurement)
+    d_asc = weighted_sum(d_asc)
+    weighted[:, _ASC] = d_asc[:, 0]
+    weighted[:, _ASC + 1] = d_asc[:, 2]
+    weighted[:, _MEAN] = weighted_sum(d_coefficients)
+    weighted[:, _LOADING] = weighted_sum(d_coefficients * lv[..., None])
+    weighted[:, _SD] = weighted_sum(d_coefficients * xi)
+    return scale, conditional.sum(axis=1), weighted
+
+
+def loglikelihood_and_score(beta, panel, draws, chunk=None):
+    """Simulated log-likelihood, gradient and per-person scores of the HCM.
+
+    The joint conditional likelihood of person n at draw r is the panel
+    choice probability times the measurement factor, L_nr = C_nr * M_nr.
+    Its log-derivative is accumulated analytically: the choice part through
+    the logit residuals as in rpl_uc, the measurement part through the
+    logistic densities at the thresholds (with tau2 = tau1 + delta2 and
+    tau3 = tau2 + delta3 propagated to tau1 and the deltas), and LVEnv
+    collects both before being chained to the bsc_* coefficients.  The
+    L-weighted sums are accumulated over chunks of ``chunk`` draws, in
+    single precision (float32 draws and a mixed_logit.single panel) with a
+    running log-sum-exp.  Returns ``(loglikelihood, gradient, scores)``.
+    """
+    beta = np.asarray(beta, dtype=float)
+    chunk = chunk or mixed_logit.chunk_size(panel, draws.shape[1], draws.shape[2])
+    scale, total, weighted = mixed_logit.sum_over_draws(
+        lambda d: _accumulate(beta, panel, d), draws, chunk)
+    scores = weighted / total[:, None]
+    return (scale + np.log(total / draws.shape[1])).sum(), scores.sum(axis=0), scores
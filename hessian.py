@@ -0,0 +1,143 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Finite-difference Hessian of the simulated log-likelihood on a process
+# pool.
+#
+# The perturbed evaluations are independent, so they are spread over worker
+# processes.  The padded panel and the draws are copied once into
+# multiprocessing.shared_memory blocks that every worker maps, so only the
+# parameter vectors travel between the processes.
+#
+# Two schemes:
+#   'gradient'  forward differences of the analytic gradient,
+#               H[:, j] = (g(beta + h_j e_j) - g(beta)) / h_j,
+#               P evaluations, with g(beta) reused from the estimation;
+#               the result is symmetrized.
+#   'function'  second differences of the log-likelihood on the upper
+#               triangle i <= j, mirrored to the lower one,
+#               (f(beta + h_i e_i + h_j e_j) - f(beta + h_i e_i)
+#                - f(beta + h_j e_j) + f(beta)) / (h_i h_j),
+#               P (P + 1) / 2 + P evaluations, f(beta) reused.
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from mixed_logit import Panel, chunk_size
+
+
+# State of a worker process: the engine function, the panel and the draws
+# as views on the shared blocks, and the blocks themselves.
+_WORKER = {}
+
+
+def _share(arrays):
+    # Copy arrays into new shared memory blocks; returns the blocks and the
+    # (block name, shape, dtype) descriptors the workers attach to.
+    blocks, descriptors = [], []
+    for array in arrays:
+        if array is None:
+            descriptors.append(None)
+            continue
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        descriptors.append((block.name, array.shape, array.dtype.str))
+    return blocks, descriptors
+
+
+def _attach(loglikelihood_and_score, descriptors, chunk):
+    arrays, blocks = [], []
+    for descriptor in descriptors:
+        if descriptor is None:
+            arrays.append(None)
+            continue
+        name, shape, dtype = descriptor
+        block = shared_memory.SharedMemory(name=name)
+        arrays.append(np.ndarray(shape, dtype, buffer=block.buf))
+        blocks.append(block)
+    _WORKER.update(function=loglikelihood_and_score, panel=Panel(*arrays[:-1]),
+                   draws=arrays[-1], chunk=chunk, blocks=blocks)
+
+
+def _evaluate(beta):
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        value, gradient = _WORKER['function'](beta, _WORKER['panel'], _WORKER['draws'],
+                                              _WORKER['chunk'])[:2]
+    return value, gradient
+
+
+def steps(beta, scale):
+    """Relative step sizes, scale * max(|beta|, 1)."""
+    return scale * np.maximum(np.abs(beta), 1.0)
+
+
+def hessian(loglikelihood_and_score, beta, panel, draws, loglikelihood=None, gradient=None,
+            method='gradient', processes=None, chunk=None):
+    """Finite-difference Hessian of the log-likelihood at ``beta``.
+
+    ``loglikelihood_and_score(beta, panel, draws)`` is an engine function
+    (rpl_uc's or hcm's, or model_spec.kernel(spec)); ``loglikelihood`` and
+    ``gradient`` at ``beta``, e.g. from estimation.estimate, are reused when
+    given.  ``method`` is 'gradient' or 'function' (see above) and
+    ``processes`` the size of the pool, all cores by default.  ``chunk``
+    is the number of draws per chunk of every worker; by default the
+    memory budget of mixed_logit.chunk_size is split between the workers.
+    """
+    beta = np.asarray(beta, dtype=float)
+    n = len(beta)
+    if method == 'gradient':
+        h = steps(beta, np.sqrt(np.finfo(float).eps))
+        points = [beta + h[j] * np.eye(n)[j] for j in range(n)]
+    elif method == 'function':
+        h = steps(beta, np.finfo(float).eps ** 0.25)
+        pairs = [(i, j) for i in range(n) for j in range(i, n)]
+        points = ([beta + h[i] * np.eye(n)[i] for i in range(n)]
+                  + [beta + h[i] * np.eye(n)[i] + h[j] * np.eye(n)[j] for i, j in pairs])
+    else:
+        raise ValueError("method must be 'gradient' or 'function', not %r" % (method,))
+
+    if method == 'gradient' and gradient is None or method == 'function' and loglikelihood is None:
+        points.append(beta)
+
+    processes = processes or os.cpu_count()
+    chunk = chunk or chunk_size(panel, draws.shape[1], draws.shape[2], processes)
+    blocks, descriptors = _share(list(panel) + [draws])
+    try:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(processes, mp_context=context, initializer=_attach,
+                                 initargs=(loglikelihood_and_score, descriptors,
+                                           chunk)) as pool:
+            batch = max(1, len(points) // (4 * processes))
+            results = list(pool.map(_evaluate, points, chunksize=batch))
+    finally:
+        # The parent owns the blocks; the workers only map them.
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    if method == 'gradient':
+        if gradient is None:
+            gradient = results.pop()[1]
+        columns = np.array([result[1] for result in results]) - gradient
+        matrix = (columns / h[:, None]).T
+        return (matrix + matrix.T) / 2
+
+    if loglikelihood is None:
+        loglikelihood = results.pop()[0]
+    values = np.array([result[0] for result in results])
+    single, double = values[:n], values[n:]
+    matrix = np.empty((n, n))
+    for (i, j), value in zip(pairs, double):
+        matrix[i, j] = matrix[j, i] = ((value - single[i] - single[j] + loglikelihood)
+                                       / (h[i] * h[j]))
+    return matrix
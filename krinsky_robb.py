@@ -0,0 +1,170 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Krinsky-Robb confidence intervals of the simulated WTP distributions.
+#
+# The WTP simulation of the R script (and of wtp.py) plugs the point
+# estimates into the ratios and only draws the random coefficients, so the
+# sampling uncertainty of the estimates is ignored.  Here parameter vectors
+# are drawn from N(estimates, covariance), with the covariance matrix stored
+# by run_models, the population WTP simulation of wtp.simulate is run at
+# every parameter draw, and the percentiles of each WTP statistic over the
+# parameter draws give its confidence interval.
+#
+# The parameter draws are independent, so they are spread over a process
+# pool.  Every parameter draw simulates from its own child of one
+# numpy.random.SeedSequence, so the results depend on the seed only, not on
+# the number of processes or the order in which the tasks complete.
+#
+# Usage:
+#   python krinsky_robb.py --draws 500 --iterations 1000 --processes 32
+#   python krinsky_robb.py --models HCM --countries NI --output kr.json
+
+import argparse
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import results_store
+import wtp
+from wtp import COUNTRIES, MODELS
+
+
+# Number of parameter draws
+KR_DRAWS = 200
+
+# Confidence level of the intervals
+LEVEL = 0.95
+
+
+# State of a worker process: the model and the person covariates.
+_WORKER = {}
+
+
+def _attach(model, covariates, n_iterations, block):
+    _WORKER.update(model=model, covariates=covariates, n_iterations=n_iterations,
+                   block=block)
+
+
+def _simulate(task):
+    beta, seed = task
+    summaries = wtp.simulate(_WORKER['model'], beta, _WORKER['covariates'],
+                             _WORKER['n_iterations'], seed, _WORKER['block'])
+    return {attribute: s.summary() for attribute, s in summaries.items()}
+
+
+def parameter_draws(estimates, covariance, n_draws, seed):
+    """``n_draws`` parameter vectors (n_draws x parameters) from
+    N(estimates, covariance).
+
+    A covariance matrix that is not numerically positive definite is
+    factored through its eigendecomposition with the negative eigenvalues
+    set to zero.
+    """
+    estimates = np.asarray(estimates, dtype=float)
+    covariance = np.asarray(covariance, dtype=float)
+    try:
+        factor = np.linalg.cholesky(covariance)
+    except np.linalg.LinAlgError:
+        values, vectors = np.linalg.eigh((covariance + covariance.T) / 2)
+        factor = vectors * np.sqrt(np.clip(values, 0, None))
+    rng = np.random.default_rng(seed)
+    return estimates + rng.standard_normal((n_draws, len(estimates))) @ factor.T
+
+
+def krinsky_robb(model, estimates, covariance, covariates, n_draws=KR_DRAWS,
+                 n_iterations=1000, seed=17, processes=None, block=wtp.BLOCK):
+    """WTP statistics at ``n_draws`` parameter draws.
+
+    ``estimates`` and ``covariance`` follow the PARAMETERS of the model's
+    engine; every parameter draw runs wtp.simulate with ``n_iterations``
+    draws per respondent.  ``processes`` is the size of the pool, all cores
+    by default.  Returns a dict attribute -> statistic -> array over the
+    parameter draws, with the statistics of StreamingSummary.summary.
+    """
+    parameters, *streams = np.random.SeedSequence(seed).spawn(n_draws + 1)
+    betas = parameter_draws(estimates, covariance, n_draws, parameters)
+
+    processes = processes or os.cpu_count()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(min(processes, n_draws), mp_context=context, initializer=_attach,
+                             initargs=(model, np.asarray(covariates), n_iterations,
+                                       block)) as pool:
+        results = list(pool.map(_simulate, zip(betas, streams)))
+
+    return {attribute: {statistic: np.array([result[attribute][statistic]
+                                             for result in results])
+                        for statistic in results[0][attribute]}
+            for attribute in wtp.WTP_ATTRIBUTES}
+
+
+def intervals(samples, level=LEVEL):
+    """Percentile intervals: attribute -> statistic -> (lower, median, upper)."""
+    tail = 100 * (1 - level) / 2
+    return {attribute: {statistic: tuple(np.percentile(values, [tail, 50, 100 - tail]).tolist())
+                        for statistic, values in statistics.items() if statistic != 'count'}
+            for attribute, statistics in samples.items()}
+
+
+def population(model, country, n_draws=KR_DRAWS, n_iterations=1000, seed=17, path=None,
+               directory=results_store.RESULTS_DIRECTORY, processes=None, block=wtp.BLOCK):
+    """krinsky_robb() at the stored estimates and covariance matrix of a
+    model for the respondents of a country."""
+    import panel_data
+    names, estimates, covariance = results_store.covariance(model, country, directory)
+    order = [names.index(name) for name in wtp.parameters(model)]
+    covariates = panel_data.load(country, path or panel_data.DATA_FILE).covariates
+    return krinsky_robb(model, estimates[order], covariance[np.ix_(order, order)],
+                        covariates, n_draws, n_iterations, seed, processes, block)
+
+
+def table(results, statistic='mean'):
+    """One line per model, country and attribute for one statistic."""
+    lines = ['%-7s %-9s %-12s %12s %10s %10s %10s'
+             % ('model', 'country', 'attribute', 'statistic', 'lower', 'median', 'upper')]
+    for (model, country), statistics in results.items():
+        for attribute, interval in statistics.items():
+            lines.append('%-7s %-9s %-12s %12s %10.2f %10.2f %10.2f'
+                         % ((model, country, attribute, statistic) + interval[statistic]))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Krinsky-Robb intervals of the WTP.')
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=list(MODELS))
+    parser.add_argument('--countries', nargs='+', choices=COUNTRIES, default=list(COUNTRIES))
+    parser.add_argument('--draws', type=int, default=KR_DRAWS,
+                        help='number of parameter draws')
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help='WTP draws per respondent and parameter draw')
+    parser.add_argument('--seed', type=int, default=17)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--level', type=float, default=LEVEL)
+    parser.add_argument('--data', default='ThreeModelComparisonENERGY.txt')
+    parser.add_argument('--output', help='write all intervals to this JSON file')
+    args = parser.parse_args()
+
+    results = {}
+    for model in args.models:
+        for country in args.countries:
+            samples = population(model, country, args.draws, args.iterations, args.seed,
+                                 args.data, processes=args.processes)
+            results[model, country] = intervals(samples, args.level)
+    for statistic in ('mean', 'median'):
+        print(table(results, statistic))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump([{'model': model, 'country': country, 'level': args.level,
+                        'wtp': statistics}
+                       for (model, country), statistics in results.items()], f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
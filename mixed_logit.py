@@ -0,0 +1,235 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Panel mixed logit kernel shared by the native RPL-UC and HCM engines.
+#
+# Instead of Biogeme's row-by-row, draw-by-draw interpretation of
+# bioLogit -> Prod(prob,'panelObsIter') -> MonteCarlo, the utilities of all
+# choice tasks of a respondent are obtained for all draws at once with a
+# batched matrix product:
+#
+#     (persons x draws x 7 coefficients) @ (persons x 7 x tasks*3 alternatives)
+#
+# Tasks are padded to the longest panel; padded tasks carry a False mask and
+# do not contribute to the sequence probability.
+#
+# The draws are processed in chunks: the engines return per-chunk sums of
+# the conditional probabilities (and of their score contributions), which
+# are added up before the simulated probabilities are formed, so the peak
+# memory depends on the chunk size rather than on the number of draws.
+#
+# Single precision is opt-in: with a float32 panel (see single()) and
+# float32 draws the hot tensors are float32, the panel products are
+# accumulated as sums of log-probabilities and the chunks are combined with
+# a running log-sum-exp.  Parameters, the log-likelihood and the scores
+# stay float64.
+
+import os
+from collections import namedtuple
+
+import numpy as np
+
+
+# The seven attributes of the choice experiment, in the order of the
+# R_bbATTR* random coefficients of the Biogeme scripts.
+ATTRIBUTES = ('ATTR1hh2', 'ATTR1hh3', 'ATTR2coast2', 'ATTR2coast3',
+              'ATTR3cost', 'ATTR4perk1', 'ATTR4perk2')
+
+# Position of the lognormal cost coefficient, R_bbATTR3cost = -exp(...)
+COST = ATTRIBUTES.index('ATTR3cost')
+
+N_ALTERNATIVES = 3
+
+# Share of the available memory the tensors of one chunk of draws may take
+MEMORY_FRACTION = 0.25
+
+# Data columns altJattrK..., e.g. alt1attr1hh2
+ATTRIBUTE_COLUMNS = [['alt%d%s' % (j, attribute.lower()) for attribute in ATTRIBUTES]
+                     for j in range(1, N_ALTERNATIVES + 1)]
+
+
+# attributes: (persons x tasks x alternatives x attributes)
+# choice:     (persons x tasks), 0-based chosen alternative
+# mask:       (persons x tasks), False for padding
+# covariates: (persons x covariates), person-level explanatory variables
+# indicators: (persons x tasks x indicators), attitudinal indicators of the
+#             hybrid choice model on every choice row, or None
+Panel = namedtuple('Panel', ['attributes', 'choice', 'mask', 'covariates', 'indicators'],
+                   defaults=(None,))
+
+
+def pack_panel(ids, attributes, choice, covariates, indicators=None):
+    """Pack row-level choice data into a padded Panel.
+
+    ``ids`` (rows,), ``attributes`` (rows x 3 x 7), ``choice`` (rows,) coded
+    1..3 as in the data file, ``covariates`` (rows x C) constant within a
+    respondent and, for the hybrid choice model, ``indicators`` (rows x I).
+    As with Biogeme's metaIterator, the rows of a respondent must be
+    contiguous; panel_data.PanelData removes that requirement.
+    """
+    ids = np.asarray(ids)
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    offsets = np.r_[starts, len(ids)]
+    return pad_panel(offsets, np.asarray(attributes, dtype=float), np.asarray(choice) - 1,
+                     np.asarray(covariates, dtype=float)[starts],
+                     None if indicators is None else np.asarray(indicators, dtype=float))
+
+
+def pad_panel(offsets, attributes, choice, covariates, indicators=None):
+    """Padded Panel from rows grouped by respondent.
+
+    ``offsets`` (persons + 1,) delimit the rows of every respondent,
+    ``choice`` is 0-based and ``covariates`` are person-level.  When every
+    respondent answered the same number of tasks the row arrays are only
+    reshaped, without copying.
+    """
+    lengths = np.diff(offsets)
+    n_persons, n_tasks = len(lengths), lengths.max()
+    if np.all(lengths == n_tasks):
+        def pad(rows):
+            return rows.reshape((n_persons, n_tasks) + rows.shape[1:])
+        mask = np.broadcast_to(True, (n_persons, n_tasks))
+    else:
+        person = np.repeat(np.arange(n_persons), lengths)
+        task = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+
+        def pad(rows):
+            padded = np.zeros((n_persons, n_tasks) + rows.shape[1:], dtype=rows.dtype)
+            padded[person, task] = rows
+            return padded
+        mask = pad(np.ones(offsets[-1], dtype=bool))
+    return Panel(pad(attributes), pad(choice), mask, covariates,
+                 None if indicators is None else pad(indicators))
+
+
+def persons(panel, start, stop):
+    """Respondents start..stop-1 of a Panel, as views."""
+    return Panel(*(None if array is None else array[start:stop] for array in panel))
+
+
+def chunk_size(panel, n_draws, n_dims, evaluators=1):
+    """Draws per chunk so that one chunk fits in MEMORY_FRACTION of the
+    available memory; all ``n_draws`` if they fit or the available memory
+    is unknown.  ``evaluators`` evaluations of the panel running at the
+    same time, e.g. in separate processes, share the budget."""
+    n_persons, n_tasks = panel.choice.shape
+    # Values per person and draw: utilities, probabilities and residuals of
+    # the tasks, the draws and coefficient derivatives, and the 28
+    # measurement derivatives of the HCM with their indicator terms.
+    per_draw = (panel.attributes.itemsize * n_persons
+                * (4 * n_tasks * N_ALTERNATIVES + 4 * n_dims + 64))
+    try:
+        available = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return n_draws
+    return int(min(n_draws, max(1, MEMORY_FRACTION * available // (per_draw * evaluators))))
+
+
+def single(panel):
+    """The Panel with float32 attributes, covariates and indicators."""
+    def cast(array):
+        return None if array is None else array.astype(np.float32)
+    return panel._replace(attributes=cast(panel.attributes), covariates=cast(panel.covariates),
+                          indicators=cast(panel.indicators))
+
+
+def sum_over_draws(accumulate, draws, chunk):
+    """Add up ``accumulate(draws[:, start:start + chunk])`` over the chunks.
+
+    ``accumulate`` returns ``(scale, sum, ...)``: per-person sums over the
+    draws of its chunk (persons x ...), each to be multiplied by
+    exp(scale) (persons,).  The chunks are combined in float64 with a
+    running maximum of the scales, so nothing overflows or underflows;
+    returns ``(scale, sum, ...)`` of all draws.  With scale 0 this is a
+    plain sum.
+    """
+    total = None
+    for start in range(0, draws.shape[1], chunk):
+        scale, *sums = accumulate(draws[:, start:start + chunk])
+        sums = [np.asarray(part, dtype=float) for part in sums]
+        if total is None:
+            total = [scale] + sums
+            continue
+        common = np.maximum(total[0], scale)
+        old, new = np.exp(total[0] - common), np.exp(scale - common)
+        total = [common] + [a * old.reshape(a.shape[:1] + (1,) * (a.ndim - 1))
+                            + b * new.reshape(b.shape[:1] + (1,) * (b.ndim - 1))
+                            for a, b in zip(total[1:], sums)]
+    return tuple(total)
+
+
+def utilities(coefficients, asc, attributes):
+    """Utilities (persons x draws x tasks x alternatives).
+
+    ``coefficients`` are the simulated random coefficients
+    (persons x draws x attributes) and ``asc`` the alternative specific
+    constants (alternatives,).
+    """
+    n_persons, n_tasks, n_alternatives, n_attributes = attributes.shape
+    design = attributes.reshape(n_persons, n_tasks * n_alternatives, n_attributes)
+    v = np.matmul(coefficients, design.transpose(0, 2, 1))
+    return v.reshape(n_persons, -1, n_tasks, n_alternatives) + asc
+
+
+def logit(v):
+    """Logit probabilities over the last (alternatives) axis."""
+    p = np.exp(v - v.max(axis=-1, keepdims=True))
+    p /= p.sum(axis=-1, keepdims=True)
+    return p
+
+
+def sequence_probability(p, choice, mask):
+    """Probability of each respondent's sequence of choices, per draw.
+
+    Equivalent of Prod(prob,'panelObsIter'): the chosen-alternative
+    probabilities are multiplied over the (unpadded) tasks of the panel.
+    Returns (persons x draws).
+    """
+    chosen = np.take_along_axis(p, choice[:, None, :, None], axis=-1)[..., 0]
+    return np.where(mask[:, None, :], chosen, 1.0).prod(axis=-1)
+
+
+def sequence_weights(p, choice, mask, log_factor=None):
+    """Sequence probabilities of a chunk of draws, as ``(scale, weights)``.
+
+    C_nr = exp(scale_n) * weights_nr, times exp(``log_factor``) (persons x
+    draws) if given, e.g. the HCM measurement factor.  In double precision
+    the panel product is formed in linear space as in Biogeme and the
+    scale is 0; in single precision the log-probabilities are summed over
+    the tasks together with ``log_factor``, and the weights are taken
+    relative to the largest draw of every person.
+    """
+    if p.dtype == np.float64:
+        weights = sequence_probability(p, choice, mask)
+        if log_factor is not None:
+            weights *= np.exp(log_factor)
+        return np.zeros(len(p)), weights
+    chosen = np.take_along_axis(p, choice[:, None, :, None], axis=-1)[..., 0]
+    # A task probability below the smallest float32 (1e-38) is floored there
+    chosen = np.maximum(chosen, np.finfo(chosen.dtype).tiny)
+    log_weights = np.where(mask[:, None, :], np.log(chosen), 0).sum(axis=-1)
+    if log_factor is not None:
+        log_weights += log_factor
+    scale = log_weights.max(axis=1)
+    return scale.astype(float), np.exp(log_weights - scale[:, None])
+
+
+def sequence_score(p, choice, mask, attributes):
+    """Derivatives of the log sequence probability, per draw.
+
+    Returns the derivatives with respect to the random coefficients
+    (persons x draws x attributes) and to the alternative specific
+    constants (persons x draws x alternatives).  Both follow from the logit
+    residuals y - p summed over the tasks of the panel, the former through
+    one batched matrix product with the design.
+    """
+    n_persons, n_tasks, n_alternatives, n_attributes = attributes.shape
+    chosen = choice[..., None] == np.arange(n_alternatives)
+    residual = (chosen[:, None] - p) * mask[:, None, :, None]
+    design = attributes.reshape(n_persons, n_tasks * n_alternatives, n_attributes)
+    d_coefficients = np.matmul(residual.reshape(n_persons, -1, n_tasks * n_alternatives), design)
+    return d_coefficients, residual.sum(axis=2)
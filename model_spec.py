@@ -0,0 +1,115 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# One model specification parameterized by model type and country.
+#
+# The three HCM scripts and the three RPL-UC scripts only differ in the
+# country clause of their exclusion rule and in the starting values of the
+# Beta definitions.  A ModelSpec carries both, read from the scripts, while
+# the likelihood itself is the native engine of the model type.  Specs that
+# share a structure (model, parameter layout, bounds and draw dimensions)
+# hash to the same key, under which results_store keeps their results.
+#
+# The RPL-C model has no Biogeme script; it is estimated with gmnl in
+# ThreeModelComparisonENERGY_2021_09_14.R, whose starting.values (shared by
+# the three countries) are its starting values, without bounds.
+
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+
+SCRIPT = 'ThreeModelComparisonENERGY-%s-%s.py'
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+R_SCRIPT = 'ThreeModelComparisonENERGY_2021_09_14.R'
+
+# Engine module and number of draw dimensions of every model type
+ENGINES = {'HCM': 'hcm', 'RPL-UC': 'rpl_uc', 'RPL-C': 'rpl_c'}
+N_DIMS = {'HCM': 8, 'RPL-UC': 7, 'RPL-C': 7}
+
+# Beta('name', value, lower, upper, fixed, 'description')
+_BETA = re.compile(r"Beta\(\s*'([^']*)'\s*,\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,]+),")
+
+# starting.values <- c( ... )
+_STARTING_VALUES = re.compile(r"starting\.values\s*<-\s*c\(([^)]*)\)")
+
+ModelSpec = namedtuple('ModelSpec', ['model', 'country', 'parameters', 'start', 'bounds',
+                                     'n_dims'])
+
+
+def script_betas(model, country, directory=SCRIPT_DIRECTORY):
+    """Starting values and bounds of the Beta definitions of a script.
+
+    Returns a dict name -> (value, lower, upper).
+    """
+    with open(os.path.join(directory, SCRIPT % (model, country))) as f:
+        text = f.read()
+    return {name.strip(): (float(value), float(lower), float(upper))
+            for name, value, lower, upper, _ in _BETA.findall(text)}
+
+
+def r_starting_values(directory=SCRIPT_DIRECTORY):
+    """The gmnl starting.values of the R script, in gmnl's order."""
+    with open(os.path.join(directory, R_SCRIPT)) as f:
+        match = _STARTING_VALUES.search(f.read())
+    return np.array([float(value) for value in match.group(1).split(',')])
+
+
+def engine(model):
+    """The engine module (rpl_uc, hcm or rpl_c) of a model type."""
+    return __import__(ENGINES[model])
+
+
+def build(model, country, directory=SCRIPT_DIRECTORY):
+    """ModelSpec of a model type and country.
+
+    Starting values and bounds come from the script of the pair, in the
+    parameter order of the engine (for RPL-C, from the R script).
+    """
+    parameters = tuple(engine(model).PARAMETERS)
+    if model == 'RPL-C':
+        start = engine(model).from_gmnl(r_starting_values(directory))
+        return ModelSpec(model, country, parameters, start, [(None, None)] * len(parameters),
+                         N_DIMS[model])
+    betas = script_betas(model, country, directory)
+    missing = [name for name in parameters if name not in betas]
+    if missing:
+        raise ValueError('%s has no Beta for %s' % (SCRIPT % (model, country), ', '.join(missing)))
+    return ModelSpec(model, country, parameters,
+                     np.array([betas[name][0] for name in parameters]),
+                     [betas[name][1:] for name in parameters], N_DIMS[model])
+
+
+def structure(spec):
+    """Everything of a spec that determines the likelihood function."""
+    return {'model': spec.model,
+            'parameters': list(spec.parameters),
+            'bounds': [list(bound) for bound in spec.bounds],
+            'n_dims': spec.n_dims}
+
+
+def structure_hash(spec):
+    """Short hash of structure(spec); equal across countries."""
+    text = json.dumps(structure(spec), sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def kernel(spec):
+    """``loglikelihood_and_score(beta, panel, draws)`` of a spec.
+
+    The engine is imported and its parameter layout checked against the
+    spec.
+    """
+    module = engine(spec.model)
+    if tuple(module.PARAMETERS) != tuple(spec.parameters):
+        raise ValueError('parameters of %s do not match the %s engine'
+                         % (spec.model, module.__name__))
+    return module.loglikelihood_and_score
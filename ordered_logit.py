@@ -0,0 +1,87 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Shared-threshold ordered logit kernel for the attitudinal measurement model.
+#
+# The meKLVEnv dictionaries of the HCM scripts compute
+# exp(tau - alpha * LVEnv) / (1 + exp(...)) up to twice per category and
+# select the observed Zenv with Elem.  Here the thresholds are shared:
+# tau1..tau3 are padded with -inf and +inf, the two thresholds bounding
+# each respondent's observed category are picked with an index gather, and
+# the category probability is the difference of two logistic CDF values.
+# The evaluation covers persons x draws x 7 indicators in one array
+# operation.
+
+import numpy as np
+from scipy.special import expit
+
+
+# Levels of the demeaned indicators, Zenv = -3 / -1 / 1 / 3
+CATEGORIES = (-3, -1, 1, 3)
+
+
+def category_index(z):
+    """Map Zenv values -3/-1/1/3 to category indices 0..3."""
+    return ((np.asarray(z) + 3) // 2).astype(np.intp)
+
+
+def thresholds(parameters):
+    """Cumulative thresholds (indicators x 3) from (indicators x 4) rows
+    tau1, delta2, delta3, alpha: tau2 = tau1 + delta2, tau3 = tau2 + delta3."""
+    return np.cumsum(parameters[:, :3], axis=1)
+
+
+def probabilities(parameters, lv, category):
+    """Probabilities of the observed categories and their log-derivatives.
+
+    ``parameters`` (indicators x 4) holds tau1, delta2, delta3 and alpha of
+    every indicator, ``lv`` is LVEnv (persons x draws) and ``category`` the
+    observed category indices (persons x indicators).  Returns
+
+    - ``p``: (persons x draws x indicators)
+    - ``d_parameters``: derivatives of log p with respect to tau1, delta2,
+      delta3 and alpha, (persons x draws x indicators x 4)
+    - ``d_lv``: derivatives of log p with respect to LVEnv,
+      (persons x draws x indicators)
+    """
+    n_indicators = len(parameters)
+    alpha = parameters[:, 3]
+    padded = np.full((n_indicators, 5), np.inf, dtype=parameters.dtype)
+    padded[:, 0] = -np.inf
+    padded[:, 1:4] = thresholds(parameters)
+
+    # The observed category only involves its two bounding thresholds, so
+    # they are gathered per person before the logistic is applied.
+    # F(-inf) = 0 and F(inf) = 1 with zero density close the outer
+    # categories.  When both thresholds lie in the upper tail the
+    # difference is taken on the complements, F(u) - F(l) = F(-l) - F(-u),
+    # which avoids cancelling two values close to 1 (in float32 the
+    # probability would round to zero); the densities are symmetric.
+    rows = np.arange(n_indicators)
+    index = alpha * lv[..., None]
+    upper = padded[rows, category + 1][:, None, :] - index
+    lower = padded[rows, category][:, None, :] - index
+    sign = np.where(upper + lower > 0, -1, 1).astype(upper.dtype)
+    upper = expit(sign * upper)
+    lower = expit(sign * lower)
+    p = sign * (upper - lower)
+    upper *= 1.0 - upper
+    lower *= 1.0 - lower
+    upper /= p
+    lower /= p
+
+    # d log p / d tau_m is +density / p at the upper threshold of the
+    # observed category and -density / p at its lower one.  With the
+    # cumulative parameterization tau1 enters all thresholds, delta2 the
+    # last two and delta3 the last one.
+    d_parameters = np.empty(p.shape + (4,), dtype=p.dtype)
+    d_parameters[..., 0] = upper - lower
+    for m in (1, 2):
+        d_parameters[..., m] = (upper * (category >= m)[:, None, :]
+                                - lower * (category >= m + 1)[:, None, :])
+    d_parameters[..., 3] = -lv[..., None] * d_parameters[..., 0]
+    return p, d_parameters, -alpha * d_parameters[..., 0]
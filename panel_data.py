@@ -0,0 +1,119 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Packed person-level design of ThreeModelComparisonENERGY.txt.
+#
+# Biogeme's metaIterator('personIter','__dataFile__','panelObsIter','ID')
+# relies on the rows of a respondent being adjacent in the file and walks
+# them again on every likelihood evaluation.  Here the data are converted
+# once into contiguous arrays, sorted by ID with a stable sort (so unsorted
+# input is fine and the task order within a respondent is kept):
+#
+#   attributes  (rows x 3 alternatives x 7 attributes), from altJattr*
+#   choice      (rows,), 0-based chosen alternative
+#   indicators  (rows x 7), demeaned attitudinal indicators Zenv1..Zenv7
+#   covariates  (persons x 9), in the order of rpl_uc.DEMOGRAPHICS
+#   offsets     (persons + 1,), CSR-style: the rows of person n are
+#               offsets[n]:offsets[n + 1]
+#
+# The columns are read from the binary cache of data_cache.py, and the
+# covariates and indicators are the derived variables of derived.py.
+
+import numpy as np
+
+import data_cache
+import derived
+import exclusion
+from data_cache import DATA_FILE
+from mixed_logit import ATTRIBUTE_COLUMNS, N_ALTERNATIVES, pad_panel
+from rpl_uc import DEMOGRAPHICS
+
+
+# Attitudinal indicators of the HCM, derived from env1..env7
+INDICATORS = ['Zenv%d' % i for i in range(1, 8)]
+
+
+def demographics(columns):
+    """The nine person covariates, in the order of rpl_uc.DEMOGRAPHICS."""
+    return np.column_stack([derived.value(columns, name) for name in DEMOGRAPHICS]).astype(float)
+
+
+def indicators(columns):
+    """Zenv1..Zenv7: env 1..4 recoded to -3, -1, 1, 3."""
+    return np.column_stack([derived.value(columns, name) for name in INDICATORS]).astype(float)
+
+
+class PanelData:
+    """Choice data packed by respondent.
+
+    All arrays are contiguous and in ID order; ``persons(start, stop)``
+    returns views on a range of respondents without copying.
+    """
+
+    def __init__(self, ids, offsets, attributes, choice, covariates, indicators):
+        self.ids = ids
+        self.offsets = offsets
+        self.attributes = attributes
+        self.choice = choice
+        self.covariates = covariates
+        self.indicators = indicators
+
+    @property
+    def n_persons(self):
+        return len(self.ids)
+
+    @property
+    def n_rows(self):
+        return len(self.choice)
+
+    def tasks(self):
+        """Number of choice tasks of every respondent."""
+        return np.diff(self.offsets)
+
+    def persons(self, start, stop):
+        """Respondents start..stop-1 as a PanelData of views."""
+        first, last = self.offsets[start], self.offsets[stop]
+        return PanelData(self.ids[start:stop], self.offsets[start:stop + 1] - first,
+                         self.attributes[first:last], self.choice[first:last],
+                         self.covariates[start:stop], self.indicators[first:last])
+
+    def padded(self):
+        """The data as a mixed_logit.Panel for the likelihood engines.
+
+        Zero-copy when every respondent answered the same number of tasks.
+        """
+        return pad_panel(self.offsets, self.attributes, self.choice,
+                         self.covariates, self.indicators)
+
+
+def build(columns, keep=None):
+    """Pack the (kept) rows of a column dict into a PanelData.
+
+    Only the kept rows are gathered, so excluded rows never reach the
+    likelihood engines.
+    """
+    rows = np.arange(len(columns['ID'])) if keep is None else np.flatnonzero(keep)
+    rows = rows[np.argsort(columns['ID'][rows], kind='stable')]
+    ids = columns['ID'][rows]
+
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    offsets = np.r_[starts, len(rows)]
+
+    attributes = np.empty((len(rows), N_ALTERNATIVES, len(ATTRIBUTE_COLUMNS[0])))
+    for j, names in enumerate(ATTRIBUTE_COLUMNS):
+        for k, name in enumerate(names):
+            attributes[:, j, k] = columns[name][rows]
+    choice = columns['Choice'][rows].astype(np.intp) - 1
+
+    return PanelData(ids[starts], offsets, attributes, choice,
+                     demographics(columns)[rows[starts]], indicators(columns)[rows])
+
+
+def load(country, path=DATA_FILE):
+    """PanelData of the estimation sample of a country (name or code)."""
+    columns = data_cache.columns(path)
+    return build(columns, ~exclusion.excluded(columns, country))
@@ -0,0 +1,117 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Store of estimation results, keyed by model, country and spec hash.
+#
+# The scripts carry starting values copied by hand from earlier runs, and
+# the R script copies the HCM estimates from the PythonBiogeme output.
+# Here every run appends its result to
+#
+#   results/<model>-<country>-<structure hash>.json
+#
+# and the latest converged estimates of a key are the starting values of
+# the next run and the input of the WTP computations; run_models also
+# stores their covariance matrix for the Krinsky-Robb draws.  A change of the
+# model structure changes the hash, so stale vectors are never reused.
+
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import model_spec
+
+
+RESULTS_DIRECTORY = 'results'
+
+
+def path(spec, directory=RESULTS_DIRECTORY):
+    """File holding the results of a spec."""
+    name = '%s-%s-%s.json' % (spec.model, spec.country, model_spec.structure_hash(spec))
+    return os.path.join(directory, name)
+
+
+def history(spec, directory=RESULTS_DIRECTORY):
+    """All stored results of a spec, oldest first."""
+    try:
+        with open(path(spec, directory)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def save(spec, result, directory=RESULTS_DIRECTORY, **settings):
+    """Append an estimation result (as returned by estimation.estimate).
+
+    ``settings`` such as the number of draws are stored with it.  The file
+    is rewritten under a temporary name and renamed into place.
+    """
+    record = {'model': spec.model,
+              'country': spec.country,
+              'structure': model_spec.structure_hash(spec),
+              'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'names': list(spec.parameters),
+              'estimates': np.asarray(result['estimates'], dtype=float).tolist(),
+              'loglikelihood': float(result['loglikelihood']),
+              'converged': bool(result['converged'])}
+    record.update(settings)
+    records = history(spec, directory) + [record]
+
+    os.makedirs(directory, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(suffix='.json', dir=directory)
+    try:
+        with os.fdopen(handle, 'w') as f:
+            json.dump(records, f, indent=1)
+        os.replace(temporary, path(spec, directory))
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return record
+
+
+def latest(spec, directory=RESULTS_DIRECTORY):
+    """The latest converged result of a spec, or None."""
+    converged = [record for record in history(spec, directory) if record['converged']]
+    return converged[-1] if converged else None
+
+
+def start_values(spec, directory=RESULTS_DIRECTORY):
+    """Latest converged estimates of a spec, else the script starting values."""
+    record = latest(spec, directory)
+    if record is None:
+        return spec.start
+    return np.array(record['estimates'])
+
+
+def estimates(model, country, directory=RESULTS_DIRECTORY):
+    """Latest converged estimates of a model and country, as a dict name -> value.
+
+    Raises LookupError when the model has not been estimated yet.
+    """
+    spec = model_spec.build(model, country)
+    record = latest(spec, directory)
+    if record is None:
+        raise LookupError('no converged %s estimates for %s in %s'
+                          % (model, country, path(spec, directory)))
+    return dict(zip(record['names'], record['estimates']))
+
+
+def covariance(model, country, directory=RESULTS_DIRECTORY):
+    """Estimates and their covariance matrix from the latest converged result.
+
+    Returns ``(names, estimates, covariance)``.  Raises LookupError when
+    there is no converged result or it was stored without a covariance
+    matrix.
+    """
+    spec = model_spec.build(model, country)
+    record = latest(spec, directory)
+    if record is None or 'covariance' not in record:
+        raise LookupError('no converged %s estimates with a covariance matrix for %s in %s'
+                          % (model, country, path(spec, directory)))
+    return record['names'], np.array(record['estimates']), np.array(record['covariance'])
@@ -0,0 +1,175 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Native simulated log-likelihood of the random parameter logit model with
+# correlated parameters (RPL-C), the gmnl(..., correlation = TRUE) model of
+# ThreeModelComparisonENERGY_2021_09_14.R:
+#
+#   index_k = b_k + sum_d b_k.d * d + (L xi)_k,   xi standard normal (7)
+#   R_k     = index_k                                        (normal)
+#   R_cost  = -exp(index_cost)                               (lognormal)
+#
+# with L the 7 x 7 lower-triangular Cholesky factor of the covariance of
+# the random coefficients.  gmnl's "ln" coefficient exp(index) multiplies
+# the negated cost (opposite = "attr3cost"), which is -exp(index) on the
+# cost as in the other engines.  The correlated errors of all persons and
+# draws are one batched matrix product draws @ L', and the likelihood is
+# evaluated as in rpl_uc.py.
+
+import numpy as np
+
+import mixed_logit
+import rpl_uc
+from mixed_logit import ATTRIBUTES, COST
+from rpl_uc import DEMOGRAPHICS, asc
+
+
+# Covariates interacted with every random coefficient, in the order of the
+# mvar lists of the gmnl calls (num_children and ideo are numchild and
+# polorient here).  They are read from Panel.covariates, which follows
+# rpl_uc.DEMOGRAPHICS.
+INTERACTIONS = ('age', 'female', 'cohabit', 'numchild', 'higheduc',
+                'employed', 'green', 'polorient', 'highincome')
+
+N_RANDOM = len(ATTRIBUTES)
+
+# (row, column) of the Cholesky entries, column by column as in gmnl
+CHOLESKY = [(i, j) for j in range(N_RANDOM) for i in range(j, N_RANDOM)]
+
+
+def _interaction_names(attribute):
+    # 'ATTR1hh2' -> bbATTR1ageEnvhh2, ..., bbATTR1highincomeEnvhh2
+    prefix, level = attribute[:5], attribute[5:]
+    return ['bb%s%sEnv%s' % (prefix, interaction, level) for interaction in INTERACTIONS]
+
+
+# Parameter vector layout, in the order of gmnl's coefficients (beta_hats
+# in the R script): ASCs, means, interactions, Cholesky entries.
+PARAMETERS = (['ASC1', 'ASC3']
+              + ['bb' + attribute for attribute in ATTRIBUTES]
+              + [name for attribute in ATTRIBUTES for name in _interaction_names(attribute)]
+              + ['L_%s_%s' % (ATTRIBUTES[i], ATTRIBUTES[j]) for i, j in CHOLESKY])
+
+_COLUMNS = [DEMOGRAPHICS.index(name) for name in INTERACTIONS]
+_INTERACTION = 2 + N_RANDOM
+_CHOLESKY = _INTERACTION + N_RANDOM * len(INTERACTIONS)
+
+# Positions in PARAMETERS of the (constant + interactions) x attributes
+# coefficient matrix of the means.
+_COEFFICIENTS = np.vstack([np.arange(2, 2 + N_RANDOM)[None, :],
+                           _INTERACTION + len(INTERACTIONS) * np.arange(N_RANDOM)[None, :]
+                           + np.arange(len(INTERACTIONS))[:, None]])
+_ROWS, _COLS = np.array(CHOLESKY).T
+
+
+def from_gmnl(coefficients):
+    """Parameter vector from gmnl's coefficients (e.g. beta_hats[1:100])."""
+    coefficients = np.asarray(coefficients, dtype=float)
+    if coefficients.shape != (len(PARAMETERS),):
+        raise ValueError('expected %d gmnl coefficients, got %s'
+                         % (len(PARAMETERS), coefficients.shape))
+    return coefficients
+
+
+def cholesky(beta):
+    """Lower-triangular Cholesky factor L (7 x 7), Gamma in the R script."""
+    beta = np.asarray(beta)
+    factor = np.zeros((N_RANDOM, N_RANDOM), dtype=beta.dtype)
+    factor[_ROWS, _COLS] = beta[_CHOLESKY:]
+    return factor
+
+
+def covariance(beta):
+    """Covariance matrix L L' of the random coefficient indices."""
+    factor = cholesky(beta)
+    return factor @ factor.T
+
+
+def coefficient_means(beta, covariates):
+    """Individual-specific means of the random coefficients (persons x 7)."""
+    return (rpl_uc.design(covariates[:, _COLUMNS])
+            @ np.asarray(beta)[_COEFFICIENTS].astype(covariates.dtype))
+
+
+def coefficients(beta, covariates, draws):
+    """Simulated random coefficients (persons x draws x 7)."""
+    return _coefficients(beta, coefficient_means(beta, covariates), draws)
+
+
+def _coefficients(beta, means, draws):
+    b = means[:, None, :] + draws @ cholesky(beta).T
+    b[..., COST] = -np.exp(b[..., COST])
+    return b
+
+
+def _conditional(beta, panel, means, draws):
+    # As rpl_uc._conditional
+    beta = beta.astype(draws.dtype)
+    b = _coefficients(beta, means, draws)
+    v = mixed_logit.utilities(b, asc(beta).astype(draws.dtype), panel.attributes)
+    p = mixed_logit.logit(v)
+    return mixed_logit.sequence_weights(p, panel.choice, panel.mask) + (p, b)
+
+
+def loglikelihood(beta, panel, draws, chunk=None):
+    """Simulated log-likelihood of the RPL-C model.
+
+    ``beta`` follows PARAMETERS, ``panel`` is a mixed_logit.Panel whose
+    covariates follow rpl_uc.DEMOGRAPHICS, and ``draws`` are independent
+    standard normal draws of shape (persons x draws x 7), correlated here
+    through the Cholesky factor.  Chunks and precision as in
+    rpl_uc.loglikelihood.
+    """
+    beta = np.asarray(beta, dtype=float)
+    chunk = chunk or mixed_logit.chunk_size(panel, draws.shape[1], draws.shape[2])
+    means = coefficient_means(beta.astype(draws.dtype), panel.covariates)
+
+    def accumulate(d):
+        scale, weights = _conditional(beta, panel, means, d)[:2]
+        return scale, weights.sum(axis=1)
+    scale, total = mixed_logit.sum_over_draws(accumulate, draws, chunk)
+    return (scale + np.log(total / draws.shape[1])).sum()
+
+
+def _accumulate(beta, panel, x, means, draws):
+    # Sum over the draws of C_nr and of C_nr * d log C_nr (persons x
+    # parameters), both relative to exp(scale); ``x`` and ``means`` as in
+    # rpl_uc._accumulate
+    scale, conditional, p, b = _conditional(beta, panel, means, draws)
+    d_coefficients, d_asc = mixed_logit.sequence_score(p, panel.choice, panel.mask,
+                                                       panel.attributes)
+
+    d_coefficients[..., COST] *= b[..., COST]
+    d_index = d_coefficients * conditional[..., None]
+    d_means = d_index.sum(axis=1)
+    # d index_i / d L_ij = xi_j
+    d_factor = np.einsum('nri,nrj->nij', d_index, draws)
+    d_asc = (d_asc * conditional[..., None]).sum(axis=1)
+
+    weighted = np.empty((len(conditional), len(PARAMETERS)), dtype=conditional.dtype)
+    weighted[:, 0] = d_asc[:, 0]
+    weighted[:, 1] = d_asc[:, 2]
+    weighted[:, _COEFFICIENTS] = x[:, :, None] * d_means[:, None, :]
+    weighted[:, _CHOLESKY:] = d_factor[:, _ROWS, _COLS]
+    return scale, conditional.sum(axis=1), weighted
+
+
+def loglikelihood_and_score(beta, panel, draws, chunk=None):
+    """Simulated log-likelihood, gradient and per-person scores.
+
+    As rpl_uc.loglikelihood_and_score, with the derivative with respect to
+    the Cholesky entry L_ij chained through d index_i / d L_ij = xi_j.
+    Returns ``(loglikelihood, gradient, scores)``.
+    """
+    beta = np.asarray(beta, dtype=float)
+    chunk = chunk or mixed_logit.chunk_size(panel, draws.shape[1], draws.shape[2])
+    x = rpl_uc.design(panel.covariates[:, _COLUMNS])
+    means = x @ beta.astype(draws.dtype)[_COEFFICIENTS].astype(x.dtype)
+    scale, total, weighted = mixed_logit.sum_over_draws(
+        lambda d: _accumulate(beta, panel, x, means, d), draws, chunk)
+    scores = weighted / total[:, None]
+    return (scale + np.log(total / draws.shape[1])).sum(), scores.sum(axis=0), scores
@@ -0,0 +1,174 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Native simulated log-likelihood of the random parameter logit model with
+# uncorrelated parameters and socio-demographic interactions (RPL-UC), as
+# specified in ThreeModelComparisonENERGY-RPL-UC-*.py:
+#
+#   R_bbATTRk = bbATTRk + sum_d bbATTRk<d>Env * d + sdbATTRk * draw   (normal)
+#   R_bbATTR3cost = -exp( same index for the cost attribute )          (lognormal)
+#
+# The likelihood is evaluated as one persons x draws x alternatives tensor
+# computation (see mixed_logit.py) rather than through Biogeme's expression
+# interpreter.
+
+import numpy as np
+
+import mixed_logit
+from mixed_logit import ATTRIBUTES, COST
+
+
+# Person-level covariates interacted with every random coefficient, in the
+# order of the Biogeme scripts.  Panel.covariates must follow this order.
+DEMOGRAPHICS = ('age', 'cohabit', 'employed', 'female', 'green',
+                'higheduc', 'highincome', 'numchild', 'polorient')
+
+
+def _coefficient_names(attribute):
+    # 'ATTR1hh2' -> bbATTR1hh2, bbATTR1ageEnvhh2, ..., sdbATTR1hh2
+    prefix, level = attribute[:5], attribute[5:]
+    return (['bb' + attribute]
+            + ['bb%s%sEnv%s' % (prefix, demographic, level) for demographic in DEMOGRAPHICS]
+            + ['sdb' + attribute])
+
+
+# Parameter vector layout, in the order of the Beta definitions of the scripts
+PARAMETERS = ['ASC1', 'ASC3'] + [name for attribute in ATTRIBUTES
+                                 for name in _coefficient_names(attribute)]
+
+_BLOCK = len(DEMOGRAPHICS) + 2
+_MEAN = [2 + _BLOCK * k for k in range(len(ATTRIBUTES))]
+_SD = [first + _BLOCK - 1 for first in _MEAN]
+
+# Positions in PARAMETERS of the (constant + demographics) x attributes
+# coefficient matrix of the means: column k holds bbATTRk and its
+# interactions.
+_COEFFICIENTS = np.array(_MEAN)[None, :] + np.arange(_BLOCK - 1)[:, None]
+
+
+def asc(beta):
+    """Alternative specific constants (ASC1, 0, ASC3)."""
+    return np.array([beta[0], 0.0, beta[1]])
+
+
+def design(covariates):
+    """Covariates with a leading constant column (persons x 10)."""
+    matrix = np.empty((len(covariates), _BLOCK - 1), dtype=covariates.dtype)
+    matrix[:, 0] = 1
+    matrix[:, 1:] = covariates
+    return matrix
+
+
+def coefficient_matrix(beta):
+    """Coefficients of the means, (constant + demographics) x attributes."""
+    return np.asarray(beta)[_COEFFICIENTS]
+
+
+def coefficient_means(beta, covariates):
+    """Individual-specific means of the random coefficients (persons x 7).
+
+    One matrix product design(covariates) @ coefficient_matrix(beta).
+    """
+    return design(covariates) @ coefficient_matrix(beta).astype(covariates.dtype)
+
+
+def coefficients(beta, covariates, draws):
+    """Simulated random coefficients (persons x draws x 7)."""
+    return _coefficients(beta, coefficient_means(beta, covariates), draws)
+
+
+def _coefficients(beta, means, draws):
+    b = means[:, None, :] + np.asarray(beta)[_SD] * draws
+    b[..., COST] = -np.exp(b[..., COST])
+    return b
+
+
+def _conditional(beta, panel, means, draws):
+    # Sequence probabilities as (scale, weights), see
+    # mixed_logit.sequence_weights, and the logit probabilities; computed in
+    # the precision of the draws.  ``means`` are the coefficient means of
+    # the panel, computed once per evaluation rather than per chunk.
+    beta = beta.astype(draws.dtype)
+    b = _coefficients(beta, means, draws)
+    v = mixed_logit.utilities(b, asc(beta).astype(draws.dtype), panel.attributes)
+    p = mixed_logit.logit(v)
+    return mixed_logit.sequence_weights(p, panel.choice, panel.mask) + (p, b)
+
+
+def loglikelihood(beta, panel, draws, chunk=None):
+    """Simulated log-likelihood of the RPL-UC model.
+
+    ``beta`` follows PARAMETERS, ``panel`` is a mixed_logit.Panel whose
+    covariates follow DEMOGRAPHICS, and ``draws`` are standard normal draws
+    of shape (persons x draws x 7).  The draws are processed ``chunk`` at a
+    time, by default as many as fit in memory (mixed_logit.chunk_size).
+    With float32 draws and a mixed_logit.single panel the evaluation is in
+    single precision.
+    """
+    beta = np.asarray(beta, dtype=float)
+    chunk = chunk or mixed_logit.chunk_size(panel, draws.shape[1], draws.shape[2])
+    means = coefficient_means(beta.astype(draws.dtype), panel.covariates)
+
+    def accumulate(d):
+        scale, weights = _conditional(beta, panel, means, d)[:2]
+        return scale, weights.sum(axis=1)
+    scale, total = mixed_logit.sum_over_draws(accumulate, draws, chunk)
+    return (scale + np.log(total / draws.shape[1])).sum()
+
+
+def _accumulate(beta, panel, x, means, draws):
+    # Sum over the draws of C_nr and of C_nr * d log C_nr (persons x
+    # parameters), both relative to exp(scale); ``x`` is the design of the
+    # panel covariates and ``means`` = x @ coefficient_matrix(beta)
+    scale, conditional, p, b = _conditional(beta, panel, means, draws)
+    d_coefficients, d_asc = mixed_logit.sequence_score(p, panel.choice, panel.mask,
+                                                       panel.attributes)
+
+    # Derivative with respect to the index inside -exp(...) for the cost
+    d_coefficients[..., COST] *= b[..., COST]
+    d_index = d_coefficients * conditional[..., None]
+    d_means = d_index.sum(axis=1)
+    d_sds = (d_index * draws).sum(axis=1)
+    d_asc = (d_asc * conditional[..., None]).sum(axis=1)
+
+    weighted = np.empty((len(conditional), len(PARAMETERS)), dtype=conditional.dtype)
+    weighted[:, 0] = d_asc[:, 0]
+    weighted[:, 1] = d_asc[:, 2]
+    # d index_k / d coefficient_matrix[j, k] = design[:, j], for all blocks
+    # at once
+    weighted[:, _COEFFICIENTS] = x[:, :, None] * d_means[:, None, :]
+    weighted[:, _SD] = d_sds
+    return scale, conditional.sum(axis=1), weighted
+
+
+def loglikelihood_and_score(beta, panel, draws, chunk=None):
+    """Simulated log-likelihood, gradient and per-person scores.
+
+    The score is obtained analytically in the same pass as the simulated
+    probabilities.  With C_nr the sequence probability of person n at draw
+    r, the derivative of log P_n is the C-weighted average over draws of
+    d log C_nr, chained through
+
+        d b / d mean = 1,      d b / d sd = draw        (normal coefficients)
+        d b / d mean = b,      d b / d sd = b * draw    (b = -exp(...), cost)
+
+    and through the covariates for the interaction terms.  The weighted
+    sums and the sum of C_nr are accumulated over chunks of ``chunk`` draws
+    (see loglikelihood), with the coefficient means formed once for all
+    chunks, and divided at the end, in single precision with
+    a running log-sum-exp.  Returns
+    ``(loglikelihood, gradient, scores)`` where ``scores`` is the
+    (persons x parameters) matrix whose column sums are the gradient.
+    """
+    beta = np.asarray(beta, dtype=float)
+    chunk = chunk or mixed_logit.chunk_size(panel, draws.shape[1], draws.shape[2])
+    x = design(panel.covariates)
+    means = x @ coefficient_matrix(beta.astype(draws.dtype)).astype(x.dtype)
+    scale, total, weighted = mixed_logit.sum_over_draws(
+        lambda d: _accumulate(beta, panel, x, means, d), draws, chunk)
+    scores = weighted / total[:, None]
+    return (scale + np.log(total / draws.shape[1])).sum(), scores.sum(axis=0), scores
@@ -0,0 +1,230 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Concurrent estimation of the (country x model) matrix.
+#
+# Instead of launching the six ThreeModelComparisonENERGY-*.py scripts one
+# by one, each with numberOfThreads = "20" (and the RPL-C models through
+# gmnl in the R script), the jobs run side by side in a process pool, each
+# with its model_spec specification.  The available cores
+# are split between the jobs in proportion to their number of respondents;
+# within a job the likelihood is evaluated on that many blocks of
+# respondents in parallel threads, and BLAS/OpenMP threading is switched off
+# so that the jobs do not oversubscribe the machine.
+#
+# Usage:
+#   python run_models.py --cores 64 --output summary.json
+#   python run_models.py --models HCM --countries England NI --draws 500
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# NumPy is imported inside the jobs, after the thread variables are set.
+
+MODELS = ('HCM', 'RPL-UC', 'RPL-C')
+COUNTRIES = ('England', 'NI', 'Scotland')
+
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                    'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+def allocate(sizes, cores):
+    """Threads per job, proportional to ``sizes`` and at least one each.
+
+    Largest-remainder rounding, so the threads add up to ``cores`` whenever
+    there are at least as many cores as jobs; the threads given to small
+    jobs to reach one each are taken back from the largest allocations.
+    """
+    total = float(sum(sizes))
+    shares = [cores * size / total for size in sizes]
+    threads = [max(1, int(math.floor(share))) for share in shares]
+    for _ in range(sum(threads) - cores):
+        largest = max(range(len(threads)), key=lambda i: threads[i])
+        if threads[largest] == 1:
+            break
+        threads[largest] -= 1
+    order = sorted(range(len(sizes)), key=lambda i: threads[i] - shares[i])
+    for i in order[:max(0, cores - sum(threads))]:
+        threads[i] += 1
+    return threads
+
+
+def respondents(countries, path):
+    """Number of respondents in the estimation sample of every country."""
+    import numpy as np
+    import data_cache
+    import exclusion
+
+    columns = data_cache.columns(path)
+    return {country: len(np.unique(columns['ID'][~exclusion.excluded(columns, country)]))
+            for country in countries}
+
+
+def run_job(model, country, threads, n_draws=2000, generator='mlhs', seed=17,
+            path='ThreeModelComparisonENERGY.txt', warm_start=True, schedule=None,
+            with_hessian=False, single=False, concurrent=1):
+    """Estimate one model for one country with ``threads`` person blocks.
+
+    Starts from the latest converged estimates in results_store (unless
+    ``warm_start`` is False) and stores the result there.  Meant to run in
+    a fresh process: the BLAS/OpenMP thread variables are set before NumPy
+    is imported.  With a ``schedule`` of draw counts the estimation is
+    progressive (estimation.estimate_progressive) and ``n_draws`` is the
+    last count.  ``with_hessian`` adds standard errors from a
+    finite-difference Hessian, evaluated on ``threads`` processes.
+    ``single`` evaluates the likelihood in float32 (see mixed_logit) in
+    the intermediate stages of a schedule; without a schedule the
+    estimation runs in float32 first and is refined in double.  The final
+    estimates, scores and Hessian are always double precision.
+    ``concurrent`` is the number of jobs running at the same time, which
+    share the memory budget of the draw chunks.
+    """
+    for name in THREAD_VARIABLES:
+        os.environ[name] = '1'
+    import numpy as np
+
+    import covariance
+    import draw_cache
+    import estimation
+    import hessian
+    import mixed_logit
+    import model_spec
+    import panel_data
+    import results_store
+
+    started = time.time()
+    spec = model_spec.build(model, country)
+    data = panel_data.load(country, path)
+    panel = data.padded()
+    if schedule:
+        n_draws = schedule[-1]
+    draws = draw_cache.cached_draws(data.n_persons, n_draws, spec.n_dims, generator, seed)
+    kernel = model_spec.kernel(spec)
+    single_panel = mixed_logit.single(panel) if single else None
+
+    def stage(d, final=None):
+        # Only the stages before the last one may be single precision; the
+        # optimum, its scores and the Hessian are always double.
+        if final is None:
+            final = d.shape[1] == n_draws
+        if single_panel is not None and not final:
+            return estimation.threaded(kernel, single_panel, d.astype(np.float32), threads,
+                                       evaluators=concurrent)
+        return estimation.threaded(kernel, panel, d, threads, evaluators=concurrent)
+
+    start = results_store.start_values(spec) if warm_start else spec.start
+    if schedule:
+        result = estimation.estimate_progressive(stage, draws, start, schedule, spec.bounds,
+                                                 spec.parameters)
+    else:
+        if single:
+            # A single precision pass on all draws, refined in double
+            with stage(draws, final=False) as evaluate:
+                start = estimation.estimate(evaluate, start, spec.bounds, spec.parameters,
+                                            tol=estimation.STAGE_TOL)['estimates']
+        with stage(draws) as evaluate:
+            result = estimation.estimate(evaluate, start, spec.bounds, spec.parameters)
+
+    # BHHH standard errors from the scores of the final evaluation
+    scores = result.pop('scores')
+    estimated = covariance.bhhh(scores)
+    result['bhhh_se'] = covariance.standard_errors(estimated).tolist()
+    if with_hessian:
+        matrix = hessian.hessian(kernel, result['estimates'], panel, draws,
+                                 result['loglikelihood'], result['gradient'], processes=threads,
+                                 chunk=mixed_logit.chunk_size(panel, n_draws, spec.n_dims,
+                                                              concurrent * threads))
+        result['hessian_se'] = covariance.standard_errors(np.linalg.inv(-matrix)).tolist()
+        estimated = covariance.sandwich(scores, matrix)
+        result['robust_se'] = covariance.standard_errors(estimated).tolist()
+    # The robust covariance matrix when available, else BHHH, is stored
+    # with the estimates for the Krinsky-Robb draws (see krinsky_robb.py).
+    results_store.save(spec, result, draws=n_draws, generator=generator, seed=seed,
+                       covariance=estimated.tolist(),
+                       covariance_type='robust' if with_hessian else 'bhhh')
+    result['estimates'] = result['estimates'].tolist()
+    result['gradient'] = result['gradient'].tolist()
+    result.update(model=model, country=country, structure=model_spec.structure_hash(spec),
+                  respondents=data.n_persons, draws=n_draws, threads=threads,
+                  seconds=time.time() - started)
+    return result
+
+
+def run(models=MODELS, countries=COUNTRIES, cores=None, n_draws=2000, generator='mlhs',
+        seed=17, path='ThreeModelComparisonENERGY.txt', warm_start=True, schedule=None,
+        with_hessian=False, single=False):
+    """Estimate every (model, country) pair concurrently.
+
+    Returns the list of job results, in the order of the matrix.
+    """
+    cores = cores or os.cpu_count()
+    jobs = [(model, country) for model in models for country in countries]
+    sizes = respondents(countries, path)
+    if cores >= len(jobs):
+        threads = allocate([sizes[country] for _, country in jobs], cores)
+    else:
+        threads = [1] * len(jobs)
+
+    # spawn: every job starts from a fresh interpreter, so the thread
+    # variables take effect; one job per process for the same reason.
+    concurrent = min(cores, len(jobs))
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(concurrent, mp_context=context, max_tasks_per_child=1) as pool:
+        futures = [pool.submit(run_job, model, country, n, n_draws, generator, seed, path,
+                               warm_start, schedule, with_hessian, single, concurrent)
+                   for (model, country), n in zip(jobs, threads)]
+        return [future.result() for future in futures]
+
+
+def summary(results):
+    """One line per job."""
+    lines = ['%-7s %-9s %6s %7s %14s %6s %9s  %s'
+             % ('model', 'country', 'resp.', 'threads', 'loglikelihood', 'iter.',
+                'seconds', 'converged')]
+    for r in results:
+        lines.append('%-7s %-9s %6d %7d %14.4f %6d %9.1f  %s'
+                     % (r['model'], r['country'], r['respondents'], r['threads'],
+                        r['loglikelihood'], r['iterations'], r['seconds'], r['converged']))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Estimate the (country x model) matrix concurrently.')
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=list(MODELS))
+    parser.add_argument('--countries', nargs='+', choices=COUNTRIES, default=list(COUNTRIES))
+    parser.add_argument('--cores', type=int, default=None)
+    parser.add_argument('--draws', type=int, default=2000)
+    parser.add_argument('--schedule', type=int, nargs='+',
+                        help='progressive draw counts, e.g. 100 250 500 1000 2000')
+    parser.add_argument('--generator', default='mlhs')
+    parser.add_argument('--seed', type=int, default=17)
+    parser.add_argument('--data', default='ThreeModelComparisonENERGY.txt')
+    parser.add_argument('--cold', action='store_true',
+                        help='start from the script values, not the stored estimates')
+    parser.add_argument('--hessian', action='store_true',
+                        help='also compute Hessian and robust standard errors')
+    parser.add_argument('--single', action='store_true',
+                        help='evaluate the non-final stages in single precision')
+    parser.add_argument('--output', help='write all results to this JSON file')
+    args = parser.parse_args()
+
+    results = run(args.models, args.countries, args.cores, args.draws, args.generator,
+                  args.seed, args.data, not args.cold, args.schedule, args.hessian,
+                  args.single)
+    print(summary(results))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
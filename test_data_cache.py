@@ -0,0 +1,53 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Checks of the columnar cache on a small data file.
+
+import os
+
+import numpy as np
+import pytest
+
+import data_cache
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'data.txt'
+    path.write_text('ID age income\n1 30 2\n1 30 2\n2 99999 5\n')
+    return str(path)
+
+
+def test_columns_round_trip(source):
+    columns = data_cache.columns(source)
+    assert columns.n_rows == 3
+    assert columns['age'].dtype == np.int32
+    assert np.array_equal(columns['age'], [30, 30, 99999])
+    assert columns.manifest['columns']['age']['missing'] == 1
+
+
+def test_unchanged_source_is_not_read(source, monkeypatch):
+    data_cache.ingest(source)
+
+    def fail(path):
+        raise AssertionError('source hashed')
+    monkeypatch.setattr(data_cache, 'source_hash', fail)
+    assert data_cache.columns(source).n_rows == 3
+
+
+def test_touched_source_is_hashed_but_not_rebuilt(source, monkeypatch):
+    data_cache.ingest(source)
+    os.utime(source, ns=(0, 0))
+    monkeypatch.setattr(data_cache, 'read_table', None)
+    assert data_cache.ingest(source)['mtime_ns'] == 0
+
+
+def test_changed_source_is_rebuilt(source):
+    data_cache.ingest(source)
+    with open(source, 'a') as f:
+        f.write('3 40 1\n')
+    assert data_cache.columns(source).n_rows == 4
@@ -0,0 +1,37 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Checks of the Halton draws against the sequence of gmnl/mlogit.
+
+import numpy as np
+
+import draws
+
+
+def _mlogit_halton(prime, length, drop):
+    # Port of mlogit's halton(prime, length, drop): every pass appends
+    # prime - 1 shifted copies of the sequence so far, with the shifts
+    # 1/prime^t, ..., (prime - 1)/prime^t.
+    sequence = np.zeros(1)
+    t = 0
+    while len(sequence) < length + drop:
+        t += 1
+        shifts = np.repeat(np.arange(1, prime) / prime ** t, len(sequence))
+        sequence = np.concatenate([sequence, np.tile(sequence, prime - 1) + shifts])
+    return sequence[drop:length + drop]
+
+
+def test_halton_matches_mlogit():
+    n_persons, n_draws, n_dims = 40, 25, 8
+    points = draws.halton(n_persons, n_draws, n_dims)
+    assert points.shape == (n_persons, n_draws, n_dims)
+    for k in range(n_dims):
+        expected = _mlogit_halton(draws.HALTON_PRIMES[k], n_persons * n_draws,
+                                  draws.HALTON_DROP)
+        # gmnl gives every respondent a block of consecutive elements
+        assert np.abs(points[..., k] - expected.reshape(n_persons, n_draws)).max() < 1e-15
+
@@ -0,0 +1,32 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Checks of the optimizer wrapper on one-parameter log-likelihoods.
+
+import numpy as np
+
+import estimation
+
+
+def _quadratic(beta):
+    # log-likelihood -(beta - 1)^2 of one person, -inf beyond 5
+    if beta[0] > 5:
+        return -np.inf, np.full(1, np.nan), np.full((1, 1), np.nan)
+    gradient = -2 * (beta - 1)
+    return -(beta[0] - 1) ** 2, gradient, gradient[None, :]
+
+
+def test_finite_start_converges():
+    result = estimation.estimate(_quadratic, [3.0])
+    assert result['converged']
+    assert np.allclose(result['estimates'], 1.0, atol=1e-4)
+
+
+def test_non_finite_start_is_not_converged():
+    result = estimation.estimate(_quadratic, [10.0])
+    assert not result['converged']
+    assert not np.isfinite(result['loglikelihood'])
@@ -0,0 +1,39 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Checks of the analytic HCM gradient on the synthetic panel of conftest.
+
+import numpy as np
+import pytest
+
+import hcm
+
+
+def _row_level(panel):
+    # One respondent changes an answer between tasks, so the measurement
+    # equations are averaged over the panel rows
+    indicators = panel.indicators.copy()
+    indicators[0, 1:, 0] = -indicators[0, 0, 0]
+    return panel._replace(indicators=indicators)
+
+
+@pytest.mark.parametrize('level', ['person', 'row'])
+def test_gradient_matches_central_differences(level, panel, evaluation):
+    if level == 'row':
+        panel = _row_level(panel)
+        assert hcm.person_indicators(panel) is None
+    beta, d = evaluation('HCM')
+    value, gradient, scores = hcm.loglikelihood_and_score(beta, panel, d)
+    assert np.isfinite(value)
+    assert np.allclose(scores.sum(axis=0), gradient)
+
+    h = 1e-6 * np.maximum(np.abs(beta), 1.0)
+    differences = np.array([(hcm.loglikelihood(beta + h[j] * e, panel, d)
+                             - hcm.loglikelihood(beta - h[j] * e, panel, d)) / (2 * h[j])
+                            for j, e in enumerate(np.eye(len(beta)))])
+    error = np.abs(differences - gradient).max() / max(np.abs(gradient).max(), 1.0)
+    assert error < 1e-6
@@ -0,0 +1,67 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Checks of the draw chunking and the single-precision mode shared by the
+# engines, on the synthetic panel of conftest.
+
+import numpy as np
+import pytest
+
+import hcm
+import mixed_logit
+import rpl_c
+import rpl_uc
+
+
+ENGINES = {'RPL-UC': rpl_uc, 'HCM': hcm, 'RPL-C': rpl_c}
+
+
+@pytest.mark.parametrize('model', sorted(ENGINES))
+def test_chunks_match_single_pass(model, panel, evaluation):
+    engine = ENGINES[model]
+    beta, d = evaluation(model)
+    value, gradient, scores = engine.loglikelihood_and_score(beta, panel, d, chunk=d.shape[1])
+    for chunk in (1, 7):
+        chunked = engine.loglikelihood_and_score(beta, panel, d, chunk=chunk)
+        assert np.isclose(chunked[0], value, rtol=1e-12)
+        assert np.allclose(chunked[2], scores, rtol=1e-9, atol=1e-12)
+        assert np.isclose(engine.loglikelihood(beta, panel, d, chunk=chunk), value, rtol=1e-12)
+
+
+def test_chunk_budget_is_shared_by_evaluators(panel, monkeypatch):
+    monkeypatch.setattr(mixed_logit.os, 'sysconf', lambda name: 1 << 20)
+    alone = mixed_logit.chunk_size(panel, 10 ** 9, 8)
+    assert 1 < alone < 10 ** 9
+    assert mixed_logit.chunk_size(panel, 10 ** 9, 8, evaluators=4) == alone // 4
+    assert mixed_logit.chunk_size(panel, 10, 8) == 10
+
+
+@pytest.mark.parametrize('model', sorted(ENGINES))
+def test_single_precision_is_close_to_double(model, panel, evaluation):
+    engine = ENGINES[model]
+    beta, d = evaluation(model)
+    value, gradient = engine.loglikelihood_and_score(beta, panel, d)[:2]
+    single = mixed_logit.single(panel)
+    d32 = d.astype(np.float32)
+    for chunk in (None, 7):
+        value32, gradient32 = engine.loglikelihood_and_score(beta, single, d32, chunk)[:2]
+        assert abs(value32 - value) < 1e-5 * abs(value)
+        assert np.abs(gradient32 - gradient).max() < 1e-3 * max(np.abs(gradient).max(), 1.0)
+
+
+def test_single_precision_measurement_does_not_underflow(panel, evaluation):
+    # With high thresholds every indicator answer above the lowest is
+    # improbable; the product of the seven probabilities is below the
+    # float32 range, its log is not.
+    beta, d = evaluation('HCM')
+    beta[[hcm.PARAMETERS.index('tau%dLVEnv1' % i) for i in range(1, 8)]] = 14
+    value, gradient = hcm.loglikelihood_and_score(beta, panel, d)[:2]
+    value32, gradient32 = hcm.loglikelihood_and_score(
+        beta, mixed_logit.single(panel), d.astype(np.float32))[:2]
+    assert np.isfinite(value32) and np.all(np.isfinite(gradient32))
+    assert abs(value32 - value) < 1e-5 * abs(value)
+    assert np.abs(gradient32 - gradient).max() < 1e-3 * max(np.abs(gradient).max(), 1.0)
@@ -0,0 +1,52 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Checks of the RPL-C engine on the synthetic panel of conftest.
+
+import numpy as np
+
+import rpl_c
+import rpl_uc
+from mixed_logit import ATTRIBUTES
+
+
+def test_gradient_matches_central_differences(panel, evaluation):
+    beta, d = evaluation('RPL-C')
+    value, gradient, scores = rpl_c.loglikelihood_and_score(beta, panel, d)
+    assert np.isfinite(value)
+    assert np.allclose(scores.sum(axis=0), gradient)
+    assert np.isclose(rpl_c.loglikelihood(beta, panel, d), value, rtol=1e-12)
+
+    h = 1e-6 * np.maximum(np.abs(beta), 1.0)
+    differences = np.array([(rpl_c.loglikelihood(beta + h[j] * e, panel, d)
+                             - rpl_c.loglikelihood(beta - h[j] * e, panel, d)) / (2 * h[j])
+                            for j, e in enumerate(np.eye(len(beta)))])
+    error = np.abs(differences - gradient).max() / max(np.abs(gradient).max(), 1.0)
+    assert error < 1e-6
+
+
+def test_diagonal_factor_is_rpl_uc(panel, evaluation):
+    # With a diagonal Cholesky factor the coefficients are independent, as
+    # in RPL-UC with the standard deviations on the diagonal
+    beta, d = evaluation('RPL-C')
+    beta[rpl_c._CHOLESKY:][rpl_c._ROWS != rpl_c._COLS] = 0
+    values = dict(zip(rpl_c.PARAMETERS, beta))
+    values.update(('sdb' + attribute, values.pop('L_%s_%s' % (attribute, attribute)))
+                  for attribute in ATTRIBUTES)
+    uncorrelated = np.array([values[name] for name in rpl_uc.PARAMETERS])
+    assert np.isclose(rpl_c.loglikelihood(beta, panel, d),
+                      rpl_uc.loglikelihood(uncorrelated, panel, d), rtol=1e-12)
+
+
+def test_means_are_formed_once_per_evaluation(panel, evaluation, monkeypatch):
+    beta, d = evaluation('RPL-C')
+    calls = []
+    design = rpl_uc.design
+    monkeypatch.setattr(rpl_uc, 'design', lambda covariates: calls.append(1) or design(covariates))
+    rpl_c.loglikelihood(beta, panel, d, chunk=1)
+    rpl_c.loglikelihood_and_score(beta, panel, d, chunk=1)
+    assert len(calls) == 2
@@ -0,0 +1,37 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Checks of the analytic RPL-UC gradient on the synthetic panel of conftest.
+
+import numpy as np
+
+import rpl_uc
+
+
+def test_gradient_matches_central_differences(panel, evaluation):
+    beta, d = evaluation('RPL-UC')
+    value, gradient, scores = rpl_uc.loglikelihood_and_score(beta, panel, d)
+    assert np.isfinite(value)
+    assert np.allclose(scores.sum(axis=0), gradient)
+    assert np.isclose(rpl_uc.loglikelihood(beta, panel, d), value, rtol=1e-12)
+
+    h = 1e-6 * np.maximum(np.abs(beta), 1.0)
+    differences = np.array([(rpl_uc.loglikelihood(beta + h[j] * e, panel, d)
+                             - rpl_uc.loglikelihood(beta - h[j] * e, panel, d)) / (2 * h[j])
+                            for j, e in enumerate(np.eye(len(beta)))])
+    error = np.abs(differences - gradient).max() / max(np.abs(gradient).max(), 1.0)
+    assert error < 1e-6
+
+
+def test_means_are_formed_once_per_evaluation(panel, evaluation, monkeypatch):
+    beta, d = evaluation('RPL-UC')
+    calls = []
+    design = rpl_uc.design
+    monkeypatch.setattr(rpl_uc, 'design', lambda covariates: calls.append(1) or design(covariates))
+    rpl_uc.loglikelihood(beta, panel, d, chunk=1)
+    rpl_uc.loglikelihood_and_score(beta, panel, d, chunk=1)
+    assert len(calls) == 2
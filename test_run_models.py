@@ -0,0 +1,24 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Checks of the split of the cores between the estimation jobs.
+
+import pytest
+
+from run_models import allocate
+
+
+@pytest.mark.parametrize('sizes, cores', [([383, 1000, 900], 64), ([1, 1, 1000], 3),
+                                          ([10] * 5 + [1000], 6), ([5, 5], 7)])
+def test_threads_add_up_to_cores(sizes, cores):
+    threads = allocate(sizes, cores)
+    assert sum(threads) == cores
+    assert min(threads) >= 1
+
+
+def test_one_thread_per_job_when_cores_are_short():
+    assert allocate([1, 1, 1], 2) == [1, 1, 1]
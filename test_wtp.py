@@ -0,0 +1,46 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Checks of the streaming WTP summaries against exact NumPy statistics.
+
+import numpy as np
+from scipy import stats
+
+from wtp import StreamingSummary
+
+
+def _summary(values, blocks=7):
+    summary = StreamingSummary()
+    for block in np.array_split(values, blocks):
+        summary.update(block)
+    return summary
+
+
+def test_quantiles_match_numpy():
+    values = np.random.default_rng(0).uniform(1, 2, 1000000)
+    summary = _summary(values)
+    for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+        assert abs(summary.quantile(q) / np.quantile(values, q) - 1) < 1e-4
+
+
+def test_heavy_tailed_quantiles_and_trimmed_mean():
+    rng = np.random.default_rng(1)
+    values = 30 * rng.standard_normal(1000000) / np.exp(rng.normal(-1, 1.1, 1000000))
+    summary = _summary(values)
+    for q in (0.05, 0.25, 0.5, 0.75, 0.95):
+        exact = np.quantile(values, q)
+        assert abs(summary.quantile(q) - exact) < 1e-3 * max(abs(exact), 1)
+    assert abs(summary.trimmed_mean(0.05) - stats.trim_mean(values, 0.05)) < 1e-3
+
+
+def test_moments_are_exact():
+    values = np.random.default_rng(2).lognormal(0, 1, 100000)
+    summary = _summary(values)
+    assert summary.count == len(values)
+    assert np.isclose(summary.mean, values.mean(), rtol=1e-12)
+    assert np.isclose(summary.variance, values.var(ddof=1), rtol=1e-10)
+    assert (summary.minimum, summary.maximum) == (values.min(), values.max())
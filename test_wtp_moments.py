@@ -0,0 +1,68 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Checks of the closed-form WTP moments against the simulation of wtp.py
+# and of their delta-method standard errors against parameter draws.
+
+import numpy as np
+import pytest
+
+import model_spec
+import wtp
+import wtp_moments
+
+
+def _beta(model):
+    # Starting values of NI with a tenth of the dispersion of the cost
+    # index.  At the starting values its variance is near 3, and the
+    # simulated variance of the WTP, whose error grows as exp(8 v_c),
+    # converges too slowly to check.
+    spec = model_spec.build(model, 'NI')
+    beta = spec.start.copy()
+    for j, name in enumerate(spec.parameters):
+        if name in ('sdbATTR3cost', 'bbATTR3LVEnvcost') or name.startswith('L_ATTR3cost_'):
+            beta[j] *= 0.1
+    return beta
+
+
+@pytest.fixture(scope='module')
+def covariates(panel):
+    return panel.covariates
+
+
+@pytest.mark.parametrize('model', wtp.MODELS)
+def test_population_moments_match_simulation(model, covariates):
+    beta = _beta(model)
+    mean, variance = wtp_moments.population_moments(model, beta, covariates)
+    summaries = wtp.simulate(model, beta, covariates, n_iterations=20000)
+    for k, attribute in enumerate(wtp.WTP_ATTRIBUTES):
+        s = summaries[attribute]
+        assert abs(s.mean - mean[k]) < 5 * np.sqrt(variance[k] / s.count)
+        assert np.isclose(s.variance, variance[k], rtol=0.02)
+
+
+@pytest.mark.parametrize('model', wtp.MODELS)
+def test_standard_errors_match_parameter_draws(model, covariates):
+    beta = _beta(model)
+    covariance = np.diag((1e-3 * np.maximum(np.abs(beta), 0.1)) ** 2)
+    result = wtp_moments.delta_method(model, beta, covariance, covariates)
+    samples = np.random.default_rng(5).multivariate_normal(beta, covariance, 2000)
+    means = np.array([wtp_moments.population_moments(model, b, covariates)[0]
+                      for b in samples])
+    for k, attribute in enumerate(wtp.WTP_ATTRIBUTES):
+        assert np.isclose(means[:, k].std(), result[attribute]['mean_se'], rtol=0.1)
+
+
+def test_respondent_moments_of_one_respondent_are_the_population_moments(covariates):
+    beta = _beta('HCM')
+    covariance = np.diag((1e-2 * np.maximum(np.abs(beta), 0.1)) ** 2)
+    one = covariates[:1]
+    population = wtp_moments.delta_method('HCM', beta, covariance, one)
+    respondents = wtp_moments.respondent_delta_method('HCM', beta, covariance, one)
+    for k, attribute in enumerate(wtp.WTP_ATTRIBUTES):
+        for statistic in ('mean', 'mean_se', 'variance', 'variance_se'):
+            assert np.isclose(respondents[statistic][0, k], population[attribute][statistic])
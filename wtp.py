@@ -0,0 +1,307 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Simulated willingness to pay of the respondents, as in the "Simulating
+# WTP" section of ThreeModelComparisonENERGY_2021_09_14.R,
+#
+#   WTP_k = -(R_bbATTRk) / R_bbATTR3cost = index_k / exp(index_cost)
+#
+# with the random coefficients at the estimates and fresh normal draws.
+# Instead of filling one N * NumIter vector per attribute in a loop over
+# iterations, the draws of all attributes are generated together, a block of
+# iterations at a time, and every block is folded into a StreamingSummary
+# per attribute and discarded.  The memory use depends on the block size
+# only, so the number of iterations is limited by time alone.
+#
+# One cost draw per person and iteration is shared by the six ratios (the
+# script draws one per ratio); the distribution of each ratio is the same.
+#
+# For the correlated model (RPL-C) the script replicates the means, the
+# Cholesky-scaled errors and every covariate into NumIter * N matrices.
+# Here the person means are computed once and broadcast, and the
+# correlated errors are formed block by block, so the same block bound on
+# the memory use holds.
+#
+# Usage:
+#   python wtp.py --iterations 100000
+#   python wtp.py --models HCM --countries NI --output wtp.json
+
+import argparse
+import json
+
+import numpy as np
+
+import hcm
+import results_store
+import rpl_c
+import rpl_uc
+from mixed_logit import ATTRIBUTES, COST
+
+
+MODELS = ('HCM', 'RPL-UC', 'RPL-C')
+COUNTRIES = ('England', 'NI', 'Scotland')
+
+# The six non-cost attributes
+WTP_ATTRIBUTES = tuple(attribute for attribute in ATTRIBUTES if attribute != 'ATTR3cost')
+_RATIOS = [ATTRIBUTES.index(attribute) for attribute in WTP_ATTRIBUTES]
+
+# Ratio draws per attribute in one block
+BLOCK = 1 << 18
+
+# Histogram of a StreamingSummary: BINS bins uniform in asinh(value) on
+# [-LIMIT, LIMIT], i.e. |value| up to ~1.3e10, with a relative resolution of
+# ~0.07% away from zero; values outside go to two overflow bins.
+BINS = 1 << 16
+LIMIT = 24.0
+
+QUANTILES = (0.025, 0.05, 0.25, 0.5, 0.75, 0.95, 0.975)
+
+# Proportion cut from each tail by StreamingSummary.trimmed_mean
+TRIM = 0.05
+
+
+class StreamingSummary:
+    """Running summary of a stream of values.
+
+    The count, mean, variance, minimum and maximum are exact; the
+    quantiles and the trimmed mean are read from a histogram with fixed
+    asinh-spaced bins, which also keeps the sum of the values of each bin.
+    """
+
+    def __init__(self, bins=BINS, limit=LIMIT):
+        self.bins = bins
+        self.limit = limit
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        # underflow, bins, overflow
+        self.counts = np.zeros(bins + 2, dtype=np.int64)
+        self.sums = np.zeros(bins + 2)
+
+    def _bin(self, values):
+        position = (np.arcsinh(values) + self.limit) * (self.bins / (2 * self.limit))
+        return np.clip(np.floor(position), -1, self.bins).astype(np.int64) + 1
+
+    def _edge(self, index):
+        # Lower edge of bin ``index`` (1-based, as in counts)
+        return np.sinh((index - 1) * (2 * self.limit / self.bins) - self.limit)
+
+    def update(self, values):
+        """Add an array of values."""
+        values = np.ravel(values)
+        if not len(values):
+            return
+        block = StreamingSummary(self.bins, self.limit)
+        block.count = len(values)
+        block.mean = values.mean()
+        block.m2 = ((values - block.mean) ** 2).sum()
+        block.minimum, block.maximum = values.min(), values.max()
+        index = self._bin(values)
+        block.counts = np.bincount(index, minlength=self.bins + 2)
+        block.sums = np.bincount(index, weights=values, minlength=self.bins + 2)
+        self.merge(block)
+
+    def merge(self, other):
+        """Add the values summarized by another StreamingSummary."""
+        if (other.bins, other.limit) != (self.bins, self.limit):
+            raise ValueError('summaries with different bins cannot be merged')
+        count = self.count + other.count
+        if not count:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.counts += other.counts
+        self.sums += other.sums
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def quantile(self, q):
+        """Quantile ``q``, interpolated linearly in asinh within its bin."""
+        rank = q * self.count
+        cumulative = np.cumsum(self.counts)
+        index = min(int(np.searchsorted(cumulative, rank, side='right')), self.bins + 1)
+        if index == 0:
+            return self.minimum
+        if index == self.bins + 1:
+            return self.maximum
+        below = cumulative[index] - self.counts[index]
+        fraction = (rank - below) / self.counts[index]
+        lower, upper = np.arcsinh(self._edge(index)), np.arcsinh(self._edge(index + 1))
+        value = np.sinh(lower + fraction * (upper - lower))
+        return float(np.clip(value, self.minimum, self.maximum))
+
+    def trimmed_mean(self, proportion=TRIM):
+        """Mean without the ``proportion`` smallest and largest values.
+
+        The bins cut by the trimming points contribute their mean value
+        times the number of values kept.
+        """
+        cut = proportion * self.count
+        cumulative = np.cumsum(self.counts)
+        below = cumulative - self.counts
+        kept = np.clip(np.minimum(cumulative, self.count - cut)
+                       - np.maximum(below, cut), 0, None)
+        occupied = self.counts > 0
+        mean = np.zeros_like(self.sums)
+        mean[occupied] = self.sums[occupied] / self.counts[occupied]
+        return float((kept * mean).sum() / kept.sum())
+
+    def summary(self, quantiles=QUANTILES):
+        """Plain dict of the statistics."""
+        result = {'count': self.count, 'mean': float(self.mean), 'std': float(self.std),
+                  'min': float(self.minimum), 'max': float(self.maximum),
+                  'median': self.quantile(0.5), 'trimmed_mean': self.trimmed_mean()}
+        result.update(('q%g' % (100 * q), self.quantile(q)) for q in quantiles)
+        return result
+
+
+def _rpl_uc(beta, covariates):
+    factor = np.zeros((len(ATTRIBUTES), len(ATTRIBUTES) + 1))
+    factor[:, 1:] = np.diag(np.abs(beta[rpl_uc._SD]))
+    return rpl_uc.coefficient_means(beta, covariates), factor
+
+
+def _hcm(beta, covariates):
+    # LVEnv = structural index + omega enters every coefficient through its
+    # loading; omega is shared by the numerator and the cost.
+    loadings = beta[hcm._LOADING]
+    structural = hcm.latent_variable(beta, covariates, 0.0)
+    factor = np.zeros((len(ATTRIBUTES), len(ATTRIBUTES) + 1))
+    factor[:, 0] = loadings
+    factor[:, 1:] = np.diag(np.abs(beta[hcm._SD]))
+    return beta[hcm._MEAN] + structural * loadings, factor
+
+
+def _rpl_c(beta, covariates):
+    # Correlated through the Cholesky factor; no omega.  The R script adds
+    # Sd_mean_mat * rnorm to L_times_eta, which counts the variances twice;
+    # here the errors are L xi only, as in the likelihood.
+    factor = np.zeros((len(ATTRIBUTES), len(ATTRIBUTES) + 1))
+    factor[:, 1:] = rpl_c.cholesky(beta)
+    return rpl_c.coefficient_means(beta, covariates), factor
+
+
+_DISTRIBUTIONS = {'RPL-UC': (rpl_uc.PARAMETERS, _rpl_uc),
+                  'HCM': (hcm.PARAMETERS, _hcm),
+                  'RPL-C': (rpl_c.PARAMETERS, _rpl_c)}
+
+
+def parameters(model):
+    """Parameter names of a model, in the order of its engine."""
+    return _DISTRIBUTIONS[model][0]
+
+
+def coefficient_distribution(model, beta, covariates):
+    """Random coefficient indices of a model as (means, factor).
+
+    index_n = means[n] + factor @ (omega, xi_1, ..., xi_7), with omega and
+    xi independent standard normal; ``factor`` (7 x 8) holds the loadings
+    on omega (HCM) in its first column and the standard deviations (RPL-UC,
+    HCM) or the Cholesky factor (RPL-C) in the others.  The cost
+    coefficient is -exp(index).  ``beta`` follows the PARAMETERS of the
+    model's engine.
+    """
+    return _DISTRIBUTIONS[model][1](np.asarray(beta, dtype=float), covariates)
+
+
+def ratios(means, factor, shocks):
+    """WTP of the six attributes (..., 6) for standard normal ``shocks``
+    of shape (..., persons, 8): omega, then one per coefficient."""
+    index = shocks @ factor.T
+    index += means
+    return index[..., _RATIOS] * np.exp(-index[..., COST:COST + 1])
+
+
+def simulate(model, beta, covariates, n_iterations=1000, seed=17, block=BLOCK):
+    """Population WTP distribution at ``beta``.
+
+    ``n_iterations`` draws per respondent (NumIter), generated ``block``
+    ratio draws per attribute at a time from numpy's default generator
+    with ``seed`` (an int or a SeedSequence); the draws do not depend on
+    ``block``.  The person means are broadcast over the iterations of a
+    block and the factor is applied block by block, so the memory use is
+    a few arrays of ``block`` x 8 values whatever the number of iterations.
+    Returns a dict attribute -> StreamingSummary.
+    """
+    means, factor = coefficient_distribution(model, beta, covariates)
+    rng = np.random.default_rng(seed)
+    summaries = {attribute: StreamingSummary() for attribute in WTP_ATTRIBUTES}
+    step = max(1, block // len(means))
+    for start in range(0, n_iterations, step):
+        shocks = rng.standard_normal((min(step, n_iterations - start), len(means),
+                                      factor.shape[1]))
+        values = ratios(means, factor, shocks)
+        for k, attribute in enumerate(WTP_ATTRIBUTES):
+            summaries[attribute].update(values[..., k])
+    return summaries
+
+
+def estimates(model, country, directory=results_store.RESULTS_DIRECTORY):
+    """Stored estimates of a model as a vector in the order of its engine."""
+    values = results_store.estimates(model, country, directory)
+    return np.array([values[name] for name in parameters(model)])
+
+
+def population(model, country, n_iterations=1000, seed=17, path=None,
+               directory=results_store.RESULTS_DIRECTORY, block=BLOCK):
+    """simulate() at the stored estimates for the respondents of a country."""
+    import panel_data
+    covariates = panel_data.load(country, path or panel_data.DATA_FILE).covariates
+    return simulate(model, estimates(model, country, directory), covariates,
+                    n_iterations, seed, block)
+
+
+def table(results):
+    """One line per model, country and attribute."""
+    lines = ['%-7s %-9s %-12s %10s %10s %10s %10s %10s %10s'
+             % ('model', 'country', 'attribute', 'mean', 'std', 'trimmed',
+                'q25', 'median', 'q75')]
+    for (model, country), summaries in results.items():
+        for attribute, s in summaries.items():
+            lines.append('%-7s %-9s %-12s %10.2f %10.2f %10.2f %10.2f %10.2f %10.2f'
+                         % (model, country, attribute, s['mean'], s['std'],
+                            s['trimmed_mean'], s['q25'], s['median'], s['q75']))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate the WTP distributions.')
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=list(MODELS))
+    parser.add_argument('--countries', nargs='+', choices=COUNTRIES, default=list(COUNTRIES))
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=17)
+    parser.add_argument('--data', default='ThreeModelComparisonENERGY.txt')
+    parser.add_argument('--output', help='write all summaries to this JSON file')
+    args = parser.parse_args()
+
+    results = {}
+    for model in args.models:
+        for country in args.countries:
+            summaries = population(model, country, args.iterations, args.seed, args.data)
+            results[model, country] = {attribute: s.summary()
+                                       for attribute, s in summaries.items()}
+    print(table(results))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump([{'model': model, 'country': country, 'wtp': summaries}
+                       for (model, country), summaries in results.items()], f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
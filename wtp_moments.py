@@ -0,0 +1,160 @@
+###############################################################################
+#
+#    An empirical comparison of (un)correlated random parameter logit and
+#    hybrid choice models for environmental valuation: which model to use?
+#
+###############################################################################
+
+# Closed-form moments of the WTP ratios of the RPL-UC, HCM and RPL-C models.
+#
+# With the coefficient indices of wtp.coefficient_distribution, the
+# attribute index a and the cost index c (coefficient -exp(c)) are jointly
+# normal given the covariates, with means m_a, m_c, variances v_a, v_c and
+# covariance c_ac (through omega for HCM, through the Cholesky factor for
+# RPL-C, zero for RPL-UC).  The WTP of a respondent is W = a * exp(-c), and
+# by the lognormal moment-generating function and Stein's lemma
+#
+#   E[W]   = (m_a - c_ac) exp(-m_c + v_c / 2)
+#   E[W^2] = ((m_a - 2 c_ac)^2 + v_a) exp(-2 m_c + 2 v_c)
+#
+# For RPL-UC these reduce to E[W] = m_a exp(-m_c + v_c/2) and
+# E[W^2] = (m_a^2 + v_a) exp(-2 m_c + 2 v_c).
+#
+# The population moments are those of the mixture over the respondents,
+# i.e. the limits of the simulated mean and variance of wtp.simulate.
+# Their standard errors, and those of the moments of every respondent,
+# follow by the delta method, with the Jacobian by central differences of
+# the closed forms.
+#
+# Usage:
+#   python wtp_moments.py
+#   python wtp_moments.py --models HCM --countries NI --output moments.json
+
+import argparse
+import json
+
+import numpy as np
+
+import results_store
+import wtp
+from mixed_logit import COST
+from wtp import COUNTRIES, MODELS, WTP_ATTRIBUTES, _RATIOS
+
+
+def conditional_moments(means, factor):
+    """E[W] and E[W^2] per respondent (persons x 6) for the coefficient
+    indices of wtp.coefficient_distribution."""
+    covariance = factor @ factor.T
+    m_a, m_c = means[:, _RATIOS], means[:, COST:COST + 1]
+    v_a, v_c = np.diag(covariance)[_RATIOS], covariance[COST, COST]
+    c_ac = covariance[_RATIOS, COST]
+    first = (m_a - c_ac) * np.exp(-m_c + v_c / 2)
+    second = ((m_a - 2 * c_ac) ** 2 + v_a) * np.exp(-2 * m_c + 2 * v_c)
+    return first, second
+
+
+def moments(model, beta, covariates):
+    """Mean and variance of the WTP of every respondent (persons x 6)."""
+    first, second = conditional_moments(*wtp.coefficient_distribution(model, beta, covariates))
+    return first, second - first ** 2
+
+
+def population_moments(model, beta, covariates):
+    """Mean and variance of the WTP over the respondents and the random
+    coefficients (6,)."""
+    first, second = conditional_moments(*wtp.coefficient_distribution(model, beta, covariates))
+    mean = first.mean(axis=0)
+    return mean, second.mean(axis=0) - mean ** 2
+
+
+def jacobian(function, beta, scale=np.finfo(float).eps ** (1 / 3)):
+    """Central-difference Jacobian (outputs x parameters) of a vector
+    function, with relative steps scale * max(|beta|, 1)."""
+    beta = np.asarray(beta, dtype=float)
+    h = scale * np.maximum(np.abs(beta), 1.0)
+    columns = []
+    for j in range(len(beta)):
+        step = np.zeros_like(beta)
+        step[j] = h[j]
+        columns.append((function(beta + step) - function(beta - step)) / (2 * h[j]))
+    return np.array(columns).T
+
+
+def delta_method(model, beta, covariance, covariates):
+    """Population WTP moments with delta-method standard errors.
+
+    ``beta`` and ``covariance`` follow the PARAMETERS of the model's
+    engine.  Returns a dict attribute -> {'mean', 'mean_se', 'variance',
+    'variance_se'}.
+    """
+    def stacked(b):
+        return np.concatenate(population_moments(model, b, covariates))
+
+    values = stacked(beta)
+    gradient = jacobian(stacked, beta)
+    errors = np.sqrt(np.einsum('ij,jk,ik->i', gradient, covariance, gradient))
+    n = len(WTP_ATTRIBUTES)
+    return {attribute: {'mean': float(values[k]), 'mean_se': float(errors[k]),
+                        'variance': float(values[n + k]), 'variance_se': float(errors[n + k])}
+            for k, attribute in enumerate(WTP_ATTRIBUTES)}
+
+
+def respondent_delta_method(model, beta, covariance, covariates):
+    """WTP moments of every respondent with delta-method standard errors.
+
+    As delta_method() for the moments() of the respondents.  Returns a
+    dict with the (persons x 6) arrays 'mean', 'mean_se', 'variance' and
+    'variance_se'.
+    """
+    def stacked(b):
+        return np.concatenate(moments(model, b, covariates), axis=1).ravel()
+
+    values = stacked(beta)
+    gradient = jacobian(stacked, beta)
+    errors = np.sqrt(np.einsum('ij,jk,ik->i', gradient, covariance, gradient))
+    values, errors = values.reshape(len(covariates), 2, -1), errors.reshape(len(covariates), 2, -1)
+    return {'mean': values[:, 0], 'mean_se': errors[:, 0],
+            'variance': values[:, 1], 'variance_se': errors[:, 1]}
+
+
+def population(model, country, path=None, directory=results_store.RESULTS_DIRECTORY):
+    """delta_method() at the stored estimates and covariance matrix of a
+    model for the respondents of a country."""
+    import panel_data
+    names, estimates, covariance = results_store.covariance(model, country, directory)
+    order = [names.index(name) for name in wtp.parameters(model)]
+    covariates = panel_data.load(country, path or panel_data.DATA_FILE).covariates
+    return delta_method(model, estimates[order], covariance[np.ix_(order, order)], covariates)
+
+
+def table(results):
+    """One line per model, country and attribute."""
+    lines = ['%-7s %-9s %-12s %10s %10s %12s'
+             % ('model', 'country', 'attribute', 'mean', 'std.err.', 'std.dev.')]
+    for (model, country), statistics in results.items():
+        for attribute, s in statistics.items():
+            lines.append('%-7s %-9s %-12s %10.2f %10.2f %12.2f'
+                         % (model, country, attribute, s['mean'], s['mean_se'],
+                            np.sqrt(s['variance'])))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Closed-form WTP moments.')
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=list(MODELS))
+    parser.add_argument('--countries', nargs='+', choices=COUNTRIES, default=list(COUNTRIES))
+    parser.add_argument('--data', default='ThreeModelComparisonENERGY.txt')
+    parser.add_argument('--output', help='write all moments to this JSON file')
+    args = parser.parse_args()
+
+    results = {(model, country): population(model, country, args.data)
+               for model in args.models for country in args.countries}
+    print(table(results))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump([{'model': model, 'country': country, 'wtp': statistics}
+                       for (model, country), statistics in results.items()], f, indent=1)
+
+
+if __name__ == '__main__':
+    main()